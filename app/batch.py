@@ -0,0 +1,186 @@
+"""
+Bulk offline generation: JSONL prompts in, a sharded MIDI catalog out.
+
+    python -m app.batch prompts.jsonl --out outputs/catalog --field description
+
+Descriptions are embedded in batches, rendering is spread over a process
+pool, and every finished song is appended to <out>/manifest.jsonl so an
+interrupted run picks up where it stopped.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory is not reported
+    resource = None
+
+from core.ai_music_brain import MusicProfile, analyze_texts_to_music
+from core.midi_engine import render_to_midi
+
+
+def _read_prompts(path: Path, field: str, id_field: str, done: Set[str]) -> Iterator[Tuple[str, str]]:
+    seen: Set[str] = set()  # ids already queued in this run
+    with path.open(encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"SKIP line {n}: not JSON", file=sys.stderr)
+                continue
+            text = record.get(field)
+            if not isinstance(text, str) or not text.strip():
+                print(f"SKIP line {n}: no '{field}'", file=sys.stderr)
+                continue
+            # 0 and "" are ids too
+            song_id = record.get(id_field)
+            song_id = f"line-{n}" if song_id is None else str(song_id)
+            if song_id in done:
+                continue
+            if song_id in seen:
+                print(f"SKIP line {n}: duplicate id '{song_id}'", file=sys.stderr)
+                continue
+            seen.add(song_id)
+            yield song_id, text
+
+
+def _load_manifest(manifest: Path) -> Set[str]:
+    done: Set[str] = set()
+    if manifest.exists():
+        with manifest.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    continue  # torn last line from an interrupted run
+    return done
+
+
+def _song_path(out: Path, song_id: str) -> Path:
+    shard = hashlib.sha1(song_id.encode()).hexdigest()[:2]
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", song_id)[:120]
+    return out / shard / f"{name}.mid"
+
+
+def _render_job(profile: MusicProfile, path: str) -> float:
+    start = time.perf_counter()
+    render_to_midi(profile, path)
+    return time.perf_counter() - start
+
+
+def _chunks(items: Iterator[Tuple[str, str]], size: int) -> Iterator[List[Tuple[str, str]]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _peak_rss_mb(children: bool) -> Optional[float]:
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss / 1024  # ru_maxrss is KiB on Linux
+
+
+def run(src: Path, out: Path, field: str, id_field: str, batch_size: int, workers: int) -> Dict[str, float]:
+    out.mkdir(parents=True, exist_ok=True)
+    manifest_path = out / "manifest.jsonl"
+    done = _load_manifest(manifest_path)
+    skipped = len(done)
+
+    timings = {"embed": 0.0, "render": 0.0, "write_manifest": 0.0}
+    songs = failed = 0
+    max_pending = workers * 4  # keeps memory flat on huge inputs
+    wall = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, manifest_path.open("a", encoding="utf-8") as manifest:
+        pending = {}
+
+        def drain(block_until: int):
+            nonlocal songs, failed
+            while len(pending) > block_until:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    song_id, path, profile = pending.pop(future)
+                    try:
+                        timings["render"] += future.result()
+                    except Exception as e:
+                        # left out of the manifest, so the next run retries it
+                        print(f"FAILED '{song_id}': {e!r}", file=sys.stderr)
+                        failed += 1
+                        continue
+                    start = time.perf_counter()
+                    manifest.write(json.dumps({"id": song_id, "path": str(path), **asdict(profile)}) + "\n")
+                    manifest.flush()
+                    timings["write_manifest"] += time.perf_counter() - start
+                    songs += 1
+
+        for chunk in _chunks(_read_prompts(src, field, id_field, done), batch_size):
+            start = time.perf_counter()
+            profiles = analyze_texts_to_music([text for _, text in chunk])
+            timings["embed"] += time.perf_counter() - start
+
+            for (song_id, _), profile in zip(chunk, profiles):
+                path = _song_path(out, song_id)
+                path.parent.mkdir(exist_ok=True)
+                pending[pool.submit(_render_job, profile, str(path))] = (song_id, path, profile)
+                drain(max_pending)
+
+        drain(0)
+
+    wall = time.perf_counter() - wall
+    return {
+        "songs": songs,
+        "failed": failed,
+        "resumed_past": skipped,
+        "wall_s": wall,
+        "songs_per_s": songs / wall if wall else 0.0,
+        "embed_s": timings["embed"],
+        "render_cpu_s": timings["render"],
+        "manifest_s": timings["write_manifest"],
+        "peak_rss_main_mb": _peak_rss_mb(children=False),
+        "peak_rss_worker_mb": _peak_rss_mb(children=True),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a MIDI catalog from a JSONL file of descriptions.")
+    parser.add_argument("input", type=Path, help="JSONL file, one prompt object per line")
+    parser.add_argument("--out", type=Path, default=Path("outputs/catalog"))
+    parser.add_argument("--field", default="description", help="key holding the description text")
+    parser.add_argument("--id-field", default="id", help="key holding a stable id (line number if missing)")
+    parser.add_argument("--batch-size", type=int, default=64, help="descriptions per encoder call")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="render processes")
+    args = parser.parse_args(argv)
+
+    report = run(args.input, args.out, args.field, args.id_field, max(1, args.batch_size), max(1, args.workers))
+
+    print(f"songs:         {report['songs']} (already done: {report['resumed_past']}, failed: {report['failed']})")
+    print(f"throughput:    {report['songs_per_s']:.1f} songs/s over {report['wall_s']:.2f}s")
+    print(f"embed:         {report['embed_s']:.2f}s")
+    print(f"render (cpu):  {report['render_cpu_s']:.2f}s across workers")
+    print(f"manifest:      {report['manifest_s']:.2f}s")
+    if report["peak_rss_main_mb"] is None:
+        print("peak RSS:      not available on this platform")
+    else:
+        print(f"peak RSS:      {report['peak_rss_main_mb']:.0f} MiB main, {report['peak_rss_worker_mb']:.0f} MiB largest worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Preload-then-fork server for the web app.
+
+    python -m app.serve [--host 0.0.0.0] [--port 8000] [--workers 4]
+
+The master loads the embedding model, the genre anchor embeddings and the
+VADER lexicon once, freezes them, binds the listening socket and then forks
+uvicorn workers. The workers share the model pages with the master
+copy-on-write instead of each loading its own copy, as `uvicorn --workers`
+does. Linux/macOS only (needs os.fork).
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+# A worker that dies sooner than this after starting is restarted after this delay
+RESPAWN_BACKOFF = float(os.getenv("MEUPHONIC_RESPAWN_BACKOFF_S", "1"))
+
+
+def _freeze_model(model) -> None:
+    """
+    Puts a torch model in inference mode so that running it never writes to
+    the shared weight pages (no autograd state, no grad buffers).
+    """
+    try:
+        import torch
+    except ImportError:
+        return
+
+    torch.set_grad_enabled(False)
+    if isinstance(model, torch.nn.Module):
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad_(False)
+
+
+def preload() -> None:
+    from core import ai_music_brain
+    from core.embedder import get_embedder
+
+    start = time.perf_counter()
+    model = get_embedder()
+    _freeze_model(model)
+
+    # anchor matrices are what every request multiplies against
+    ai_music_brain._genre_anchors()
+    try:
+        from core import theory_engine  # also builds the VADER analyzer
+        theory_engine._genre_anchors()
+    except ImportError as e:
+        print("PRELOAD: skipping theory engine:", e)
+
+    import app.web  # noqa: F401  (module-level state is built once, here)
+
+    # everything allocated so far is long-lived: keep the collector from
+    # touching (and so un-sharing) those objects in the workers
+    gc.collect()
+    gc.freeze()
+    print(f"PRELOADED in {time.perf_counter() - start:.1f}s ({gc.get_freeze_count()} objects frozen)")
+
+
+def bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _worker(sock: socket.socket, workers: int, log_level: str) -> None:
+    import uvicorn
+    from app.web import app, render_pool
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    # the workers split the cores instead of each starting a full pool:
+    # torch threads, and the render processes every worker's startup hook
+    # launches (unless MEUPHONIC_RENDER_WORKERS sets them per worker)
+    share = max(1, (os.cpu_count() or 1) // workers)
+    if "MEUPHONIC_RENDER_WORKERS" not in os.environ:
+        render_pool.workers = share
+    try:
+        import torch
+        torch.set_num_threads(share)
+    except ImportError:
+        pass
+
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, workers: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _worker(sock, workers, log_level)
+        except BaseException as e:
+            print("WORKER FAILED:", e, file=sys.stderr)
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    print("WORKER STARTED:", pid)
+    return pid
+
+
+def serve(host: str, port: int, workers: int, log_level: str = "info") -> None:
+    preload()
+    sock = bind(host, port)
+    print(f"LISTENING on {host}:{port} with {workers} workers")
+
+    children: Dict[int, float] = {}
+    for _ in range(workers):
+        children[_spawn(sock, workers, log_level)] = time.monotonic()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+
+        print("WORKER EXITED:", pid, "status", status)
+        if time.monotonic() - started < RESPAWN_BACKOFF:
+            time.sleep(RESPAWN_BACKOFF)
+            if stopping:
+                continue  # told to stop while backing off; nobody would signal a new worker
+        children[_spawn(sock, workers, log_level)] = time.monotonic()
+
+    sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the web app from pre-forked workers sharing one model.")
+    parser.add_argument("--host", default=os.getenv("MEUPHONIC_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MEUPHONIC_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("MEUPHONIC_WORKERS", "2")))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(args.host, args.port, max(1, args.workers), args.log_level)
+
+
+if __name__ == "__main__":
+    main()
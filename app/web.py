@@ -1,19 +1,50 @@
-from pathlib import Path
+import asyncio
+import os
+from dataclasses import asdict
+from typing import Optional, Tuple
 
-from fastapi import FastAPI, Form
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, Form, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
+from starlette.concurrency import run_in_threadpool
 
-from core.ai_music_brain import analyze_text_to_music
-from core.midi_engine import render_to_midi
-from core.spotify_engine import SpotifyClient
+from core import metrics
+from core.ai_music_brain import MusicProfile, near_duplicates
+from core.batching import AnalysisBatcher
+from core.embedder import is_ready, warm_up
+from core.midi_engine import TICKS_PER_BEAT, TRACK_NAMES, iter_bar_events
+from core.profile_store import ProfileStore
+from core.render_cache import RENDER_CACHE_MAX_BYTES, RenderCache
+from core.render_pool import RenderPool, RenderPoolBusy
+from core.spotify_engine import CACHE_SNAPSHOT, AsyncSpotifyClient, ResponseCache
+from core.variants import plan_variants, variants_zip
 
 print("WEB APP LOADED")
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
-spotify = SpotifyClient()
+# Non-blocking: an in-flight Spotify call does not occupy a threadpool worker
+spotify = AsyncSpotifyClient(cache=ResponseCache(snapshot_path=CACHE_SNAPSHOT))
+
+# Concurrent requests share encoder passes (see MEUPHONIC_BATCH_* settings)
+batcher = AnalysisBatcher()
+
+# Analyzed profiles, so follow-up calls can pass a profile_id instead of
+# re-running the model on the same description
+profiles = ProfileStore()
+
+# Rendered songs keyed by profile; equivalent prompts skip rendering entirely
+render_cache = RenderCache() if RENDER_CACHE_MAX_BYTES > 0 else None
+
+# Rendering runs in worker processes (MEUPHONIC_RENDER_WORKERS) off the GIL
+render_pool = RenderPool()
+
+# Load the embedding model at startup instead of on the first /generate
+WARM_UP = os.getenv("MEUPHONIC_WARMUP", "0") == "1"
+
+# Paced streams send each bar this many seconds before it is due to play
+STREAM_LOOKAHEAD = float(os.getenv("MEUPHONIC_STREAM_LOOKAHEAD_S", "0.25"))
 
 GENRE_MAP = {
     "rock": "rock",
@@ -25,6 +56,46 @@ GENRE_MAP = {
 }
 
 
+# ---------------- LIFECYCLE ----------------
+
+@app.on_event("startup")
+async def startup():
+    render_pool.start()
+    if WARM_UP:
+        # runs in the background; /ready reports when it is done
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await batcher.close()
+    await spotify.aclose()
+    render_pool.shutdown()
+
+
+@app.get("/ready")
+def ready():
+    # without warm-up the model loads on demand (or is never needed, when the
+    # embedding store is warm), so there is nothing to wait for
+    if not WARM_UP or is_ready():
+        return JSONResponse({"ready": True})
+    return JSONResponse({"ready": False}, status_code=503)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats")
+def stats():
+    return JSONResponse({
+        **metrics.snapshot(),
+        "spotify_prefetch": spotify.prefetch_stats(),
+        "semantic_cache": near_duplicates.stats() if near_duplicates is not None else None,
+    })
+
+
 # ---------------- HOME ----------------
 
 @app.get("/", response_class=HTMLResponse)
@@ -32,42 +103,186 @@ def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+# ---------------- ANALYSIS ----------------
+
+async def resolve_profile(description: Optional[str], profile_id: Optional[str]) -> Tuple[str, MusicProfile]:
+    if profile_id:
+        # an id from before the text was edited does not stand for the new text
+        profile = profiles.get(profile_id, description or None)
+        if profile is not None:
+            return profile_id, profile
+
+    if not description:
+        raise HTTPException(status_code=400, detail="unknown or expired profile_id and no description given")
+
+    found = profiles.find(description)
+    if found is not None:
+        return found
+
+    profile = await batcher.analyze(description)
+    return profiles.put(description, profile), profile
+
+
+@app.post("/analyze")
+async def analyze(description: str = Form(...)):
+    profile_id, profile = await resolve_profile(description, None)
+    return JSONResponse({"profile_id": profile_id, "profile": asdict(profile)})
+
+
 # ---------------- MIDI GENERATION ----------------
 
 @app.post("/generate")
-def generate(description: str = Form(...)):
-    print("GENERATE:", description[:80])
+async def generate(description: Optional[str] = Form(None), profile_id: Optional[str] = Form(None)):
+    print("GENERATE:", (description or profile_id or "")[:80])
+
+    profile_id, profile = await resolve_profile(description, profile_id)
+
+    # from the render cache, else rendered in a worker process; never via a shared file
+    midi = await run_in_threadpool(render_cache.get, profile) if render_cache is not None else None
+    if midi is None:
+        try:
+            midi = await render_pool.render(profile)
+        except RenderPoolBusy:
+            raise HTTPException(status_code=503, detail="renderer busy, retry shortly")
+        if render_cache is not None:
+            await run_in_threadpool(render_cache.put, profile, midi)
+
+    return Response(
+        midi,
+        media_type="audio/midi",
+        headers={
+            "Content-Disposition": 'attachment; filename="meuphonic.mid"',
+            "X-Profile-Id": profile_id,
+        }
+    )
 
-    profile = analyze_text_to_music(description)
 
-    out_path = Path("outputs/meuphonic.mid")
-    out_path.parent.mkdir(exist_ok=True)
+@app.post("/generate/variants")
+async def generate_variants(
+    description: Optional[str] = Form(None),
+    profile_id: Optional[str] = Form(None),
+    count: int = Form(4),
+    seed: int = Form(0),
+):
+    print("GENERATE VARIANTS:", count, (description or profile_id or "")[:80])
 
-    midi_path = render_to_midi(profile, str(out_path))
+    # one analysis for every variant
+    profile_id, profile = await resolve_profile(description, profile_id)
+    variants = plan_variants(profile, count, seed)
 
-    return FileResponse(
-        midi_path,
-        filename="meuphonic.mid",
-        media_type="audio/midi"
+    try:
+        songs = await render_pool.render_variants(profile, variants)
+    except RenderPoolBusy:
+        raise HTTPException(status_code=503, detail="renderer busy, retry shortly")
+
+    return Response(
+        await run_in_threadpool(variants_zip, profile, variants, songs),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": 'attachment; filename="meuphonic_variants.zip"',
+            "X-Profile-Id": profile_id,
+        }
     )
 
 
+# ---------------- MIDI STREAMING ----------------
+
+def _event_json(track: int, tick: int, status: int, data1: int, data2: int, seconds_per_tick: float) -> dict:
+    event = {
+        "track": TRACK_NAMES[track],
+        "tick": tick,
+        "time": round(tick * seconds_per_tick, 4),
+        "channel": status & 0x0F,
+    }
+    kind = status & 0xF0
+    if kind == 0xC0:
+        event.update(type="program_change", program=data1)
+    else:
+        event.update(type="note_on" if kind == 0x90 else "note_off", note=data1, velocity=data2)
+    return event
+
+
+@app.websocket("/ws/generate")
+async def ws_generate(ws: WebSocket):
+    """
+    Send {"description": ...} or {"profile_id": ...}, optionally "pace": true.
+    Receives a "profile" message, then one "bar" message of timestamped
+    events per bar as soon as it is rendered (or just ahead of playback time
+    when paced), then "end".
+    """
+    await ws.accept()
+    try:
+        request = await ws.receive_json()
+        profile_id, profile = await resolve_profile(request.get("description"), request.get("profile_id"))
+    except HTTPException as exc:
+        await ws.send_json({"type": "error", "detail": exc.detail})
+        await ws.close(code=1008)
+        return
+    except (ValueError, AttributeError):
+        await ws.send_json({"type": "error", "detail": "expected a JSON object"})
+        await ws.close(code=1003)
+        return
+    except WebSocketDisconnect:
+        return
+
+    print("STREAM:", profile_id)
+    pace = bool(request.get("pace"))
+    seconds_per_tick = 60.0 / (profile.tempo * TICKS_PER_BEAT)
+
+    try:
+        await ws.send_json({
+            "type": "profile",
+            "profile_id": profile_id,
+            "profile": asdict(profile),
+            "ticks_per_beat": TICKS_PER_BEAT,
+            "tracks": list(TRACK_NAMES),
+        })
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for bar in iter_bar_events(profile):
+            if pace and bar.events:
+                delay = started + bar.events[0][1] * seconds_per_tick - STREAM_LOOKAHEAD - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            await ws.send_json({
+                "type": "bar",
+                "section": bar.section,
+                "bar": bar.bar,
+                "events": [_event_json(*e, seconds_per_tick) for e in bar.events],
+            })
+
+        await ws.send_json({"type": "end"})
+        await ws.close()
+    except WebSocketDisconnect:
+        print("STREAM CLOSED:", profile_id)
+
+
 # ---------------- SPOTIFY: ARTISTS FIRST ----------------
 
 @app.post("/spotify/artists")
-def spotify_artists(description: str = Form(...), variant: int = Form(0)):
-    print("SPOTIFY ARTISTS:", description[:80], "variant:", variant)
+async def spotify_artists(
+    description: Optional[str] = Form(None),
+    profile_id: Optional[str] = Form(None),
+    variant: int = Form(0)
+):
+    print("SPOTIFY ARTISTS:", (description or profile_id or "")[:80], "variant:", variant)
 
-    profile = analyze_text_to_music(description)
+    profile_id, profile = await resolve_profile(description, profile_id)
     genre = GENRE_MAP.get(profile.genre, "pop")
 
-    artists = spotify.popular_artists_by_genre(
+    artists = await spotify.popular_artists_by_genre(
         genre=genre,
         limit=5,
         offset=(variant % 3) * 5
     )
 
+    # the user usually picks one of these next; warm /spotify/tracks for it
+    spotify.prefetch_recommendations([a.id for a in artists], profile.energy)
+
     return JSONResponse({
+        "profile_id": profile_id,
         "artists": [a.__dict__ for a in artists]
     })
 
@@ -75,17 +290,57 @@ def spotify_artists(description: str = Form(...), variant: int = Form(0)):
 # ---------------- SPOTIFY: TRACKS FROM CHOSEN ARTIST ----------------
 
 @app.post("/spotify/tracks")
-def spotify_tracks(description: str = Form(...), artist_id: str = Form(...)):
+async def spotify_tracks(
+    artist_id: str = Form(...),
+    description: Optional[str] = Form(None),
+    profile_id: Optional[str] = Form(None)
+):
     print("SPOTIFY TRACKS:", artist_id)
 
-    profile = analyze_text_to_music(description)
+    profile_id, profile = await resolve_profile(description, profile_id)
 
-    tracks = spotify.recommend_tracks(
+    tracks = await spotify.recommend_tracks(
         seed_artists=[artist_id],
         mood_energy=profile.energy,
         limit=10
     )
 
     return JSONResponse({
+        "profile_id": profile_id,
         "tracks": [t.__dict__ for t in tracks]
     })
+
+
+# ---------------- SPOTIFY: PLAYLIST FROM TOP ARTISTS ----------------
+
+@app.post("/spotify/playlist")
+async def spotify_playlist(
+    description: Optional[str] = Form(None),
+    profile_id: Optional[str] = Form(None),
+    variant: int = Form(0),
+    artists: int = Form(5)
+):
+    print("SPOTIFY PLAYLIST:", (description or profile_id or "")[:80], "artists:", artists)
+
+    profile_id, profile = await resolve_profile(description, profile_id)
+    genre = GENRE_MAP.get(profile.genre, "pop")
+
+    top = await spotify.popular_artists_by_genre(
+        genre=genre,
+        limit=max(1, min(artists, 5)),
+        offset=(variant % 3) * 5
+    )
+
+    playlist = await spotify.recommend_for_artists(
+        [a.id for a in top],
+        mood_energy=profile.energy,
+        target_energy=profile.energy
+    )
+
+    return JSONResponse({
+        "profile_id": profile_id,
+        "artists": [a.__dict__ for a in top],
+        "tracks": [t.__dict__ for t in playlist.tracks],
+        "partial": playlist.partial,
+        "failed_artists": playlist.failed
+    })
@@ -0,0 +1,67 @@
+"""
+Peak RSS of writing songs of growing length, streamed vs. rendered in memory.
+
+    python benchmarks/bench_stream_rss.py [--bars 50 500 5000 50000]
+
+Each measurement runs in a fresh process so peaks do not carry over.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def child(mode: str, bars: int) -> None:
+    sys.path.insert(0, str(ROOT))
+    from core.ai_music_brain import MusicProfile
+    from core.midi_engine import (
+        _encode_track, _header, _tempo_meta, iter_render, new_tracks, repeat_sections, write_midi_stream
+    )
+
+    profile = MusicProfile(genre="ambient", tempo=60, scale="minor", energy=0.5)
+    start = time.perf_counter()
+    with tempfile.TemporaryFile() as out:
+        if mode == "stream":
+            size = write_midi_stream(profile, out, lambda: repeat_sections(bars))
+        else:
+            # the in-memory path: every event of every track held until the end
+            tracks = new_tracks()
+            for _ in iter_render(profile, tracks, list(repeat_sections(bars))):
+                pass
+            data = _header(len(tracks)) + _encode_track(tracks[0], _tempo_meta(profile.tempo))
+            data += b"".join(_encode_track(t) for t in tracks[1:])
+            size = out.write(data)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{peak:.1f} {size} {elapsed:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, nargs="+", default=[50, 500, 5000, 50000])
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "BARS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+
+    print(f"{'bars':>8} {'mode':>7} {'peak RSS MiB':>13} {'file KiB':>10} {'seconds':>8}")
+    for bars in args.bars:
+        for mode in ("memory", "stream"):
+            result = subprocess.run(
+                [sys.executable, __file__, "--child", mode, str(bars)],
+                capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": str(ROOT)},
+            )
+            peak, size, elapsed = result.stdout.split()
+            print(f"{bars:>8} {mode:>7} {float(peak):>13.1f} {int(size) / 1024:>10.0f} {float(elapsed):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
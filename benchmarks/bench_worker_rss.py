@@ -0,0 +1,151 @@
+"""
+Memory per serving worker: `uvicorn --workers` vs. the preload-then-fork server.
+
+    python benchmarks/bench_worker_rss.py [--workers 4] [--requests 20]
+
+Starts each server on a free port, waits until every worker has the model,
+sends a few /generate requests and then reads /proc/<pid>/smaps_rollup for
+the master and all of its descendants. RSS counts shared pages once per
+process; PSS splits them between the sharers, so the PSS total is what the
+node actually pays. USS is what each process holds on its own. Render
+processes (forkserver and pool workers) are counted and listed separately.
+Linux only.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def descendants(root: int) -> List[int]:
+    parents: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # the command name may contain spaces; ppid follows the ")"
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    found, frontier = [], [root]
+    while frontier:
+        pid = frontier.pop()
+        children = [p for p, ppid in parents.items() if ppid == pid]
+        found += children
+        frontier += children
+    return found
+
+
+def role(pid: int) -> str:
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        cmdline = f.read()
+    if b"multiprocessing.forkserver" in cmdline:
+        return "render"  # the forkserver and the pool workers it forks
+    if b"multiprocessing.resource_tracker" in cmdline:
+        return "helper"
+    return "worker"
+
+
+def smaps_rollup(pid: int) -> Dict[str, int]:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def wait_ready(port: int, workers: int, timeout: float) -> None:
+    # connections land on arbitrary workers: require a run of successes
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while streak < workers * 4:
+        if time.monotonic() > deadline:
+            raise RuntimeError("server did not become ready")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5):
+                streak += 1
+                continue
+        except (urllib.error.URLError, ConnectionError):
+            streak = 0
+        time.sleep(0.5)
+
+
+def generate(port: int, n: int) -> None:
+    for i in range(n):
+        body = urllib.parse.urlencode({"description": f"late night drive in the rain #{i}"}).encode()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/generate", data=body, timeout=60) as r:
+            r.read()
+
+
+def measure(mode: str, workers: int, requests: int, timeout: float) -> None:
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT),
+        "MEUPHONIC_WARMUP": "1",
+        "MEUPHONIC_RENDER_CACHE_MAX_BYTES": "0",
+    }
+    if mode == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "app.web:app", "--port", str(port), "--workers", str(workers)]
+    else:
+        cmd = [sys.executable, "-m", "app.serve", "--port", str(port), "--workers", str(workers)]
+
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port, workers, timeout)
+        generate(port, requests)
+        time.sleep(1)
+
+        rows = [("master", proc.pid, smaps_rollup(proc.pid))]
+        rows += [(role(pid), pid, smaps_rollup(pid)) for pid in descendants(proc.pid)]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    print(f"\n{mode} ({workers} workers)")
+    print(f"{'process':>8} {'pid':>8} {'RSS MiB':>9} {'PSS MiB':>9} {'USS MiB':>9}")
+    for role, pid, mem in rows:
+        print(f"{role:>8} {pid:>8} {mem['rss'] / 1024:>9.1f} {mem['pss'] / 1024:>9.1f} {mem['uss'] / 1024:>9.1f}")
+    total = {k: sum(mem[k] for _, _, mem in rows) / 1024 for k in ("rss", "pss", "uss")}
+    print(f"{'total':>8} {'':>8} {total['rss']:>9.1f} {total['pss']:>9.1f} {total['uss']:>9.1f}")
+    print(f"PSS per worker: {total['pss'] / workers:.1f} MiB")
+    print(f"render processes: {sum(r == 'render' for r, _, _ in rows)} (forkservers included)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20, help="/generate calls before measuring")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the model to load")
+    parser.add_argument("--modes", nargs="+", default=["uvicorn", "preload"], choices=["uvicorn", "preload"])
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        measure(mode, args.workers, args.requests, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 from dataclasses import dataclass
-from sentence_transformers import SentenceTransformer
+from typing import List, Optional, Tuple
 import numpy as np
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+from core import metrics
+from core.embedder import encode
+from core.semantic_cache import SEMANTIC_CACHE_SIZE, SemanticCache
 
 GENRES = {
     "rock": ["electric guitar", "drums", "bass", "power"],
@@ -13,6 +15,30 @@ GENRES = {
     "classical": ["orchestral", "strings", "piano"]
 }
 
+# Genre anchors are encoded once into a row-normalized matrix and only
+# re-encoded when GENRES changes.
+_anchor_key: Optional[Tuple] = None
+_anchor_genres: List[str] = []
+_anchor_matrix: Optional[np.ndarray] = None
+
+
+def _genre_anchors() -> Tuple[List[str], np.ndarray]:
+    global _anchor_key, _anchor_genres, _anchor_matrix
+
+    key = tuple((genre, tuple(keywords)) for genre, keywords in GENRES.items())
+    if key != _anchor_key:
+        with metrics.timer("anchor_encode"):
+            vecs = encode([" ".join(kw) for kw in GENRES.values()])
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        _anchor_matrix = vecs / np.maximum(norms, 1e-12)
+        _anchor_genres = list(GENRES)
+        _anchor_key = key
+        if near_duplicates is not None:
+            near_duplicates.clear()  # cached profiles were scored on the old anchors
+
+    return _anchor_genres, _anchor_matrix
+
+
 @dataclass
 class MusicProfile:
     genre: str
@@ -21,42 +47,78 @@ class MusicProfile:
     energy: float
 
 
-def analyze_text_to_music(description: str) -> MusicProfile:
-    desc_vec = model.encode(description)
+TEMPO_MAP = {
+    "ambient": 60,
+    "jazz": 90,
+    "pop": 100,
+    "rock": 120,
+    "metal": 150,
+    "classical": 70
+}
 
-    best_genre = "pop"
-    best_score = -1
+SCALE_MAP = {
+    "metal": "minor",
+    "rock": "minor",
+    "ambient": "minor",
+    "jazz": "dorian",
+    "pop": "major",
+    "classical": "minor"
+}
 
-    for genre, keywords in GENRES.items():
-        kw_vec = model.encode(" ".join(keywords))
-        score = np.dot(desc_vec, kw_vec)
-        if score > best_score:
-            best_score = score
-            best_genre = genre
 
-    energy = min(1.0, max(0.2, best_score / 10))
+def _profile_from_scores(genres: List[str], scores: np.ndarray) -> MusicProfile:
+    best = int(np.argmax(scores))
 
-    tempo_map = {
-        "ambient": 60,
-        "jazz": 90,
-        "pop": 100,
-        "rock": 120,
-        "metal": 150,
-        "classical": 70
-    }
-
-    scale_map = {
-        "metal": "minor",
-        "rock": "minor",
-        "ambient": "minor",
-        "jazz": "dorian",
-        "pop": "major",
-        "classical": "minor"
-    }
+    best_genre = genres[best]
+    best_score = float(scores[best])
+
+    energy = min(1.0, max(0.2, best_score / 10))
 
     return MusicProfile(
         genre=best_genre,
-        tempo=tempo_map[best_genre],
-        scale=scale_map[best_genre],
+        tempo=TEMPO_MAP[best_genre],
+        scale=SCALE_MAP[best_genre],
         energy=energy
     )
+
+
+# Paraphrases of a recent description get its profile back unchanged, so
+# the render cache serves them too (MEUPHONIC_SEMANTIC_* settings)
+near_duplicates: Optional[SemanticCache[MusicProfile]] = SemanticCache() if SEMANTIC_CACHE_SIZE > 0 else None
+
+
+def _profile_for(vec: np.ndarray, genres: List[str], scores: np.ndarray) -> MusicProfile:
+    if near_duplicates is None:
+        return _profile_from_scores(genres, scores)
+
+    found = near_duplicates.lookup(vec)
+    if found is not None:
+        return found[0]
+    profile = _profile_from_scores(genres, scores)
+    near_duplicates.add(vec, profile)
+    return profile
+
+
+def analyze_text_to_music(description: str) -> MusicProfile:
+    with metrics.timer("embed"):
+        desc_vec = encode(description)
+
+    with metrics.timer("genre_scoring"):
+        genres, anchors = _genre_anchors()
+        return _profile_for(desc_vec, genres, anchors @ desc_vec)
+
+
+def analyze_texts_to_music(descriptions: List[str]) -> List[MusicProfile]:
+    """
+    Batch form of analyze_text_to_music: one encoder call for all descriptions.
+    """
+    if not descriptions:
+        return []
+
+    with metrics.timer("embed"):
+        desc_vecs = encode(list(descriptions))
+
+    with metrics.timer("genre_scoring"):
+        genres, anchors = _genre_anchors()
+        scores = desc_vecs @ anchors.T
+        return [_profile_for(vec, genres, row) for vec, row in zip(desc_vecs, scores)]
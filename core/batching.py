@@ -0,0 +1,100 @@
+import asyncio
+import os
+import time
+from typing import Callable, List, Optional
+
+from core import metrics
+from core.ai_music_brain import MusicProfile, analyze_texts_to_music
+
+BATCH_MAX_SIZE = int(os.getenv("MEUPHONIC_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("MEUPHONIC_BATCH_MAX_WAIT_MS", "5"))
+
+_batch_size = metrics.histogram(
+    "analysis_batch_size", (1, 2, 4, 8, 16, 32, 64),
+    "Descriptions encoded per encoder call",
+)
+_queue_wait = metrics.histogram(
+    "analysis_queue_wait_seconds", (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+    "Time a description waited before its batch was dispatched",
+)
+
+
+class AnalysisBatcher:
+    """
+    Collects descriptions that arrive within `max_wait_ms` of the first one
+    (up to `max_batch_size`) and analyzes them with a single encoder call.
+    While a batch is encoding, the next one keeps filling up.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        analyze: Callable[[List[str]], List[MusicProfile]] = analyze_texts_to_music,
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._analyze = analyze
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def analyze(self, description: str) -> MusicProfile:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+        fut = loop.create_future()
+        self._queue.put_nowait((description, fut, time.perf_counter()))
+        return await fut
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch) -> None:
+        now = time.perf_counter()
+        _batch_size.observe(len(batch))
+        for _, _, queued in batch:
+            _queue_wait.observe(now - queued)
+
+        texts = [description for description, _, _ in batch]
+        try:
+            profiles = await asyncio.get_running_loop().run_in_executor(None, self._analyze, texts)
+        except Exception as exc:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+
+        for (_, fut, _), profile in zip(batch, profiles):
+            # callers that went away are simply skipped
+            if not fut.done():
+                fut.set_result(profile)
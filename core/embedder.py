@@ -0,0 +1,74 @@
+import os
+import threading
+from typing import Dict, List, Union
+
+import numpy as np
+
+# One SentenceTransformer per model name, shared by every engine in the process
+MODEL_NAME = os.getenv("MEUPHONIC_EMBED_MODEL", "all-MiniLM-L6-v2")
+
+_models: Dict[str, object] = {}
+_lock = threading.Lock()
+# names whose warm_up() has finished
+_warmed = set()
+
+
+def get_embedder(name: str = MODEL_NAME):
+    """
+    Returns the shared encoder for `name`, loading it on first use.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            # imported here so that importing the engines stays cheap
+            from sentence_transformers import SentenceTransformer
+
+            print("LOADING EMBEDDER:", name)
+            model = SentenceTransformer(name)
+            _models[name] = model
+
+    return model
+
+
+def warm_up(name: str = MODEL_NAME) -> None:
+    get_embedder(name)
+    _warmed.add(name)
+
+
+def is_ready(name: str = MODEL_NAME) -> bool:
+    """
+    Whether warm_up() has finished, however the model got loaded meanwhile.
+    """
+    return name in _warmed
+
+
+def encode(texts: Union[str, List[str]], normalize_embeddings: bool = False, name: str = MODEL_NAME) -> np.ndarray:
+    """
+    get_embedder(name).encode, served from the on-disk embedding store where
+    possible (see core.embedding_store): only texts it has not seen reach the
+    model, so a warm store never loads it at all.
+    """
+    from core.embedding_store import get_store
+
+    single = isinstance(texts, str)
+    batch = [texts] if single else list(texts)
+    store = get_store(name)
+
+    if store is None:
+        vecs = np.asarray(get_embedder(name).encode(batch), dtype=np.float32)
+    else:
+        found, missing = store.get_many(batch)
+        if missing:
+            fresh = np.asarray(get_embedder(name).encode([batch[i] for i in missing]), dtype=np.float32)
+            store.put_many([batch[i] for i in missing], fresh)
+            for i, vec in zip(missing, fresh):
+                found[i] = vec
+        vecs = np.stack(found) if found else np.zeros((0, 0), dtype=np.float32)
+
+    if normalize_embeddings and len(vecs):
+        vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+    return vecs[0] if single else vecs
@@ -0,0 +1,302 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is per process only
+    fcntl = None
+
+EMBED_STORE_DIR = os.getenv("MEUPHONIC_EMBED_STORE_DIR", "outputs/embed_store")
+# Compaction needs to replace a file other processes have mapped, which
+# POSIX allows and Windows does not, so the store is off there by default
+EMBED_STORE_CAPACITY = int(os.getenv("MEUPHONIC_EMBED_STORE_CAPACITY", "50000" if os.name == "posix" else "0"))
+# Share of the newest vectors kept when a full store is compacted
+EMBED_STORE_KEEP = float(os.getenv("MEUPHONIC_EMBED_STORE_KEEP", "0.5"))
+
+_hits = metrics.counter("embed_store_hits_total", "Embeddings read from the on-disk store")
+_misses = metrics.counter("embed_store_misses_total", "Embeddings that had to be computed")
+_evictions = metrics.counter("embed_store_evictions_total", "Stored embeddings dropped by compaction")
+_compactions = metrics.counter("embed_store_compactions_total", "Store files rewritten by compaction")
+
+MAGIC = b"MEUEMB01"
+HEADER_BYTES = 64
+# header words after the magic: dim, capacity, slots, count
+_DIM, _CAPACITY, _SLOTS, _COUNT = range(4)
+
+
+def text_key(text: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+def _slots_for(capacity: int) -> int:
+    # power of two, at most half full
+    return 1 << max(4, (2 * capacity - 1).bit_length())
+
+
+class _Mapping:
+    """
+    One store file mapped into memory:
+
+        header   magic + uint32 dim, capacity, slots, count
+        keys     slots x 2 uint64 (128-bit text hash, zero = empty)
+        rows     slots x int32 (vector row, -1 = empty)
+        vectors  capacity x dim float32, in insertion order
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "r+b") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.mm = np.memmap(f, dtype=np.uint8, mode="r+")
+        if bytes(self.mm[:8]) != MAGIC:
+            raise ValueError(f"{path} is not an embedding store")
+        self.header = self.mm[8:HEADER_BYTES].view(np.uint32)
+        dim, capacity, slots = (int(x) for x in self.header[:3])
+        self.dim, self.capacity, self.slots = dim, capacity, slots
+
+        offset = HEADER_BYTES
+        self.keys = self.mm[offset:offset + slots * 16].view(np.uint64).reshape(slots, 2)
+        offset += slots * 16
+        self.rows = self.mm[offset:offset + slots * 4].view(np.int32)
+        offset += slots * 4
+        self.vectors = self.mm[offset:offset + capacity * dim * 4].view(np.float32).reshape(capacity, dim)
+
+    @staticmethod
+    def create(path: Path, dim: int, capacity: int) -> None:
+        slots = _slots_for(capacity)
+        size = HEADER_BYTES + slots * 20 + capacity * dim * 4
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.truncate(size)  # sparse: vector pages cost disk only once written
+                header = np.array([dim, capacity, slots, 0], dtype=np.uint32)
+                f.write(MAGIC + header.tobytes())
+                f.seek(HEADER_BYTES + slots * 16)
+                f.write(np.full(slots, -1, dtype=np.int32).tobytes())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    @property
+    def count(self) -> int:
+        return int(self.header[_COUNT])
+
+    def find(self, key: Tuple[int, int]) -> int:
+        mask = self.slots - 1
+        slot = key[0] & mask
+        while True:
+            row = int(self.rows[slot])
+            if row < 0:
+                return -1
+            if int(self.keys[slot, 0]) == key[0] and int(self.keys[slot, 1]) == key[1]:
+                return row
+            slot = (slot + 1) & mask
+
+    def insert(self, key: Tuple[int, int], vec: np.ndarray) -> None:
+        """
+        Appends `vec` under `key`. Caller holds the write lock and has
+        checked that the key is absent and the store is not full. Writes
+        go vector, row, key so lock-free readers never match a key whose
+        row or vector is not there yet.
+        """
+        row = self.count
+        self.vectors[row] = vec
+
+        mask = self.slots - 1
+        slot = key[0] & mask
+        while self.rows[slot] >= 0:
+            slot = (slot + 1) & mask
+        self.rows[slot] = row
+        self.keys[slot, 1] = key[1]
+        self.keys[slot, 0] = key[0]
+        self.header[_COUNT] = row + 1
+
+    def flush(self) -> None:
+        self.mm.flush()
+
+
+class EmbeddingStore:
+    """
+    Disk-backed map from text to embedding vector, memory-mapped so that
+    every worker process reads the same pages. Lookups take no lock;
+    writers serialize on a flock. Vectors are append-only: when the file
+    fills up, compaction rewrites it with the newest `keep` share of the
+    vectors and atomically replaces it. Readers notice the new file (by
+    inode) on their next miss.
+    """
+
+    def __init__(self, path: str, capacity: int = EMBED_STORE_CAPACITY, keep: float = EMBED_STORE_KEEP):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.capacity = max(2, capacity)
+        self.keep = min(max(keep, 0.0), 0.9)
+        self._lock_path = self.path.with_suffix(self.path.suffix + ".lock")
+        self._thread_lock = threading.RLock()
+        self._map: Optional[_Mapping] = None
+
+    # ---- mapping ----
+
+    def _current(self) -> Optional[_Mapping]:
+        """
+        The mapping of the file now at `path`, remapping if another process
+        has compacted it since.
+        """
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+
+        m = self._map
+        if m is not None and m.inode == inode:
+            return m
+
+        self._map = None
+        if inode is not None:
+            self._map = _Mapping(self.path)
+        return self._map
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            # a fresh open file per acquisition: flock is tied to it, and a
+            # descriptor inherited across fork would be shared with the parent
+            with open(self._lock_path, "a+b") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+
+    # ---- reads ----
+
+    def get_many(self, texts: Sequence[str]) -> Tuple[List[Optional[np.ndarray]], List[int]]:
+        """
+        Returns (vectors, missing): a copy of each stored vector (None where
+        absent) and the indices of the texts that were not found.
+        """
+        keys = [text_key(t) for t in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        m = self._map
+        if m is not None:
+            for i, key in enumerate(keys):
+                row = m.find(key)
+                if row >= 0:
+                    found[i] = np.array(m.vectors[row])
+
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            # the file may have been created or compacted elsewhere
+            with self._thread_lock:
+                fresh = self._current()
+            if fresh is not None and fresh is not m:
+                for i in missing:
+                    row = fresh.find(keys[i])
+                    if row >= 0:
+                        found[i] = np.array(fresh.vectors[row])
+                missing = [i for i, v in enumerate(found) if v is None]
+
+        _hits.inc(len(texts) - len(missing))
+        _misses.inc(len(missing))
+        return found, missing
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        return self.get_many([text])[0][0]
+
+    # ---- writes ----
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("expected one row per text")
+
+        with self._locked():
+            m = self._current()
+            if m is None or m.dim != vectors.shape[1]:
+                if m is not None:
+                    print("EMBED STORE: dimension changed, starting over:", self.path)
+                _Mapping.create(self.path, vectors.shape[1], self.capacity)
+                m = self._current()
+
+            for text, vec in zip(texts, vectors):
+                key = text_key(text)
+                if m.find(key) >= 0:
+                    continue
+                if m.count >= m.capacity:
+                    self._compact(m)
+                    m = self._current()
+                m.insert(key, vec)
+
+    def put(self, text: str, vector: np.ndarray) -> None:
+        self.put_many([text], np.asarray(vector, dtype=np.float32)[None, :])
+
+    def compact(self) -> None:
+        with self._locked():
+            m = self._current()
+            if m is not None:
+                self._compact(m)
+
+    def _compact(self, m: _Mapping) -> None:
+        """
+        Rewrites the file keeping the newest `keep` share of vectors (all of
+        them if the store is not full). Caller holds the write lock.
+        """
+        count = m.count
+        drop = count - int(self.capacity * self.keep) if count >= self.capacity else 0
+
+        tmp = self.path.with_suffix(".compact")
+        _Mapping.create(tmp, m.dim, self.capacity)
+        new = _Mapping(tmp)
+        live = np.nonzero(m.rows >= drop)[0]
+        for slot in live[np.argsort(m.rows[live], kind="stable")]:
+            new.insert((int(m.keys[slot, 0]), int(m.keys[slot, 1])), m.vectors[m.rows[slot]])
+        new.flush()
+        del new
+        os.replace(tmp, self.path)
+
+        _compactions.inc()
+        _evictions.inc(drop)
+        print(f"EMBED STORE COMPACTED: kept {count - drop} of {count}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._thread_lock:
+            m = self._current()
+        return {
+            "vectors": m.count if m else 0,
+            "capacity": self.capacity,
+            "bytes": os.path.getsize(self.path) if m else 0,
+        }
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(model_name: str) -> Optional[EmbeddingStore]:
+    """
+    The shared store for `model_name`'s vectors, or None when the store is
+    disabled (MEUPHONIC_EMBED_STORE_CAPACITY=0).
+    """
+    if EMBED_STORE_CAPACITY <= 0:
+        return None
+    store = _stores.get(model_name)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(model_name)
+            if store is None:
+                slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+                store = EmbeddingStore(os.path.join(EMBED_STORE_DIR, f"{slug}.emb"))
+                _stores[model_name] = store
+    return store
@@ -1,5 +1,6 @@
+import re
 from dataclasses import dataclass
-from typing import Dict, Tuple
+from typing import Dict, Iterable, List, Set, Tuple
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
 
@@ -18,6 +19,31 @@ LABEL_KEYWORDS = {
 }
 
 
+def _compile_lexicon():
+    labels: Dict[str, List[str]] = {}
+    for label, words in LABEL_KEYWORDS.items():
+        for w in words:
+            labels.setdefault(w, []).append(label)
+
+    vocab = set(labels) | AROUSAL_UP | AROUSAL_DOWN
+    # longest first so multi-word cues win over their prefixes
+    alternation = "|".join(re.escape(w) for w in sorted(vocab, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternation})\b"), labels
+
+
+# One word-bounded pattern over every cue; call rebuild_lexicon() after editing the sets above
+_LEXICON_RE, _WORD_LABELS = _compile_lexicon()
+
+
+def rebuild_lexicon() -> None:
+    global _LEXICON_RE, _WORD_LABELS
+    _LEXICON_RE, _WORD_LABELS = _compile_lexicon()
+
+
+def _scan(text: str) -> Set[str]:
+    return set(_LEXICON_RE.findall(text))
+
+
 @dataclass
 class MoodProfile:
     description: str
@@ -28,26 +54,25 @@ class MoodProfile:
     mode: str           # major/minor
 
 
-def _keyword_label(text: str) -> Tuple[str, int]:
+def _keyword_label(found: Set[str]) -> Tuple[str, int]:
     scores: Dict[str, int] = {k: 0 for k in LABEL_KEYWORDS}
-    for label, words in LABEL_KEYWORDS.items():
-        for w in words:
-            if w in text:
-                scores[label] += 1
+    for w in found:
+        for label in _WORD_LABELS.get(w, ()):
+            scores[label] += 1
     best = max(scores, key=scores.get)
     return best, scores[best]
 
 
-def _estimate_energy(text: str, base: float) -> float:
-    tokens = set(text.split())
+def _estimate_energy(found: Set[str], base: float) -> float:
     bump = 0.0
-    bump += 0.12 * len(tokens.intersection(AROUSAL_UP))
-    bump -= 0.12 * len(tokens.intersection(AROUSAL_DOWN))
+    bump += 0.12 * len(found & AROUSAL_UP)
+    bump -= 0.12 * len(found & AROUSAL_DOWN)
     return max(0.0, min(1.0, base + bump))
 
 
 def analyze_mood(description: str) -> MoodProfile:
     text = description.lower().strip()
+    found = _scan(text)  # single pass for label and arousal cues
 
     # VADER sentiment: compound is in [-1, 1]
     sentiment = analyzer.polarity_scores(description)
@@ -55,10 +80,10 @@ def analyze_mood(description: str) -> MoodProfile:
 
     # base energy from intensity (neg/pos plus punctuation)
     base_energy = min(1.0, max(0.0, 0.35 + 0.35 * (sentiment["pos"] + sentiment["neg"])))
-    energy = _estimate_energy(text, base_energy)
+    energy = _estimate_energy(found, base_energy)
 
     # keyword label with fallback
-    label, strength = _keyword_label(text)
+    label, strength = _keyword_label(found)
     if strength == 0:
         # fallback: label from valence + energy
         if compound < -0.25 and energy < 0.55:
@@ -86,3 +111,11 @@ def analyze_mood(description: str) -> MoodProfile:
         valence=compound,
         mode=mode,
     )
+
+
+def analyze_mood_batch(descriptions: Iterable[str]) -> List[MoodProfile]:
+    """
+    analyze_mood over many texts, sharing the loaded VADER analyzer and the
+    compiled lexicon.
+    """
+    return [analyze_mood(d) for d in descriptions]
@@ -1,4 +1,9 @@
-from typing import List, Tuple
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from core import metrics
 
 # General MIDI Drum notes (channel 10 / index 9 in MIDI)
 KICK = 36
@@ -23,12 +28,16 @@ def _intensity(section: str) -> float:
     return 0.60
 
 
+def _density(section: str, energy: float) -> float:
+    inten = _intensity(section)
+    return min(1.0, max(0.0, (energy * 0.6 + inten * 0.6)))
+
+
 def groove_for_bar(genre: str, section: str, energy: float) -> List[DrumEvent]:
     """
     Returns drum hits for ONE bar (4/4), beat positions in [0,4).
     """
-    inten = _intensity(section)
-    dens = min(1.0, max(0.0, (energy * 0.6 + inten * 0.6)))
+    dens = _density(section, energy)
 
     # Ambient: very sparse (no constant ticks)
     if genre == "ambient":
@@ -108,3 +117,98 @@ def groove_for_bar(genre: str, section: str, energy: float) -> List[DrumEvent]:
 
     # Fallback: simple backbeat
     return [(KICK, 0.0, 86), (SNARE, 1.0, 86), (KICK, 2.0, 80), (SNARE, 3.0, 86)]
+
+
+# ---------------- COMPILED PATTERN TABLE ----------------
+
+# Every density threshold used by groove_for_bar; two densities that compare
+# the same way against all of them produce the same bar.
+_DENSITY_STEPS = (0.5, 0.55, 0.6, 0.65, 0.7, 0.75)
+
+_table_hits = metrics.counter("groove_table_hits_total", "Drum bars served from the compiled table")
+_table_misses = metrics.counter("groove_table_misses_total", "Drum bars compiled on demand")
+
+
+@dataclass(frozen=True)
+class CompiledGroove:
+    """
+    One bar of drums laid out for the renderer: note_on offsets (ticks, relative
+    to the drum track's clock at bar start) in playing order, each hit lasting
+    `hit_ticks`, and the total clock advance for the bar.
+    """
+    starts: array
+    notes: array
+    velocities: array
+    hit_ticks: int
+    length: int
+
+
+_TABLE: Dict[tuple, CompiledGroove] = {}
+
+
+def _section_class(section: str) -> Tuple[float, bool, bool]:
+    return _intensity(section), "Chorus" in section, "Bridge" in section
+
+
+def _density_bucket(dens: float) -> Tuple[int, int]:
+    # (thresholds strictly below, thresholds at or below) captures both > and < tests
+    return bisect_left(_DENSITY_STEPS, dens), bisect_right(_DENSITY_STEPS, dens)
+
+
+def _compile(events: List[DrumEvent], ticks_per_beat: int, hit_ticks: int) -> CompiledGroove:
+    starts = array("I")
+    notes = array("B")
+    velocities = array("B")
+
+    cursor = 0
+    last = 0
+    for note, beat, vel in sorted(events, key=lambda x: x[1]):
+        t = int(beat * ticks_per_beat)
+        cursor += max(0, t - last)
+        starts.append(cursor)
+        notes.append(note)
+        velocities.append(vel)
+        cursor += hit_ticks
+        last = t + hit_ticks
+
+    return CompiledGroove(starts, notes, velocities, hit_ticks, cursor)
+
+
+def compiled_groove(genre: str, section: str, energy: float, ticks_per_beat: int, hit_ticks: int) -> CompiledGroove:
+    """
+    groove_for_bar, sorted and quantized once per
+    (genre, section class, density bucket, resolution).
+    """
+    key = (
+        genre,
+        _section_class(section),
+        _density_bucket(_density(section, energy)),
+        ticks_per_beat,
+        hit_ticks,
+    )
+    entry = _TABLE.get(key)
+    if entry is not None:
+        _table_hits.inc()
+        return entry
+
+    _table_misses.inc()
+    with metrics.timer("groove_compile"):
+        entry = _compile(groove_for_bar(genre, section, energy), ticks_per_beat, hit_ticks)
+    _TABLE[key] = entry
+    return entry
+
+
+def groove_signature(genre: str, energy: float, sections: Iterable[str]) -> tuple:
+    """
+    The drum patterns played over `sections`: two energies with the same
+    signature sound the same.
+    """
+    return tuple(tuple(sorted(groove_for_bar(genre, section, energy))) for section in sections)
+
+
+def groove_table_stats() -> Dict[str, int]:
+    return {
+        "size": len(_TABLE),
+        "hits": _table_hits.value,
+        "misses": _table_misses.value,
+    }
@@ -1,5 +1,8 @@
-from typing import List
+from array import array
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
 from dataclasses import dataclass
+from core import metrics
 from core.ai_music_brain import MusicProfile
 
 # Scale degrees relative to tonic (in semitones)
@@ -31,6 +34,10 @@ BORROWED = {
 }
 
 
+# Semitones the tonic moves up after every chorus
+CHORUS_LIFT = 2
+
+
 @dataclass
 class HarmonicContext:
     tonic: int
@@ -38,35 +45,28 @@ class HarmonicContext:
     risk: float  # 0.0 = safe pop, 1.0 = daring jazz/metal
 
 
-def build_progression(
-    profile: MusicProfile,
-    section: str,
-    tonic: int
-) -> List[int]:
-    """
-    Returns chord roots (MIDI note numbers) for ONE BAR
-    """
+def _risk(profile: MusicProfile) -> float:
+    return min(1.0, profile.energy + (0.2 if profile.genre in ("jazz", "metal") else 0.0))
 
-    ctx = HarmonicContext(
-        tonic=tonic,
-        scale=profile.scale,
-        risk=min(1.0, profile.energy + (0.2 if profile.genre in ("jazz", "metal") else 0.0)),
-    )
 
-    # --- Section intent ---
+def _section_tension(section: str) -> float:
     if section in ("Intro", "Outro"):
-        tension = 0.2
-    elif "Verse" in section:
-        tension = 0.4
-    elif "Chorus" in section:
-        tension = 0.8
-    elif "Bridge" in section:
-        tension = 0.7
-    else:
-        tension = 0.4
+        return 0.2
+    if "Verse" in section:
+        return 0.4
+    if "Chorus" in section:
+        return 0.8
+    if "Bridge" in section:
+        return 0.7
+    return 0.4
+
+
+def _chord_offset(scale: str, risky: bool, section: str) -> int:
+    # --- Section intent ---
+    tension = _section_tension(section)
 
     # --- Safe functional harmony ---
-    if ctx.scale == "major":
+    if scale == "major":
         base = MAJOR
         tonic_deg = "I"
         dom = "V"
@@ -86,8 +86,124 @@ def build_progression(
         degree = dom
 
     # --- Risky borrowing ---
-    if ctx.risk > 0.6 and section in ("Chorus", "Bridge"):
-        degree = "bVII" if ctx.scale == "minor" else "bVI"
+    if risky and section in ("Chorus", "Bridge"):
+        degree = "bVII" if scale == "minor" else "bVI"
+
+    return base.get(degree) or BORROWED.get(degree, 0)
+
+
+def build_progression(
+    profile: MusicProfile,
+    section: str,
+    tonic: int
+) -> List[int]:
+    """
+    Returns chord roots (MIDI note numbers) for ONE BAR
+    """
+
+    ctx = HarmonicContext(
+        tonic=tonic,
+        scale=profile.scale,
+        risk=_risk(profile),
+    )
+
+    return [ctx.tonic + _chord_offset(ctx.scale, ctx.risk > 0.6, section)]
+
+
+def chord_tones(root: int, minor: bool) -> Tuple[int, int, int]:
+    return root, root + (3 if minor else 4), root + 7
+
+
+PITCH_CLASSES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+
+@lru_cache(maxsize=128)
+def progression_offsets(chords: Tuple[str, ...], key: str) -> Tuple[Tuple[int, bool], ...]:
+    """
+    Chord symbols ("Am", "Bbmaj7", "G7") as (semitones above `key`, minor),
+    so a progression written in one key can be played from any tonic.
+    Extensions are dropped: the renderer plays triads.
+    """
+    home = PITCH_CLASSES[key[0]]
+    offsets = []
+    for chord in chords:
+        pc = PITCH_CLASSES[chord[0]]
+        quality = chord[1:]
+        if quality[:1] in ("#", "b"):
+            pc += 1 if quality[0] == "#" else -1
+            quality = quality[1:]
+        minor = quality.startswith("m") and not quality.startswith("maj")
+        offsets.append(((pc - home) % 12, minor))
+    return tuple(offsets)
+
+
+# ---------------- SONG-LEVEL PLAN ----------------
+
+@dataclass(frozen=True)
+class SectionHarmony:
+    name: str
+    bars: int
+    tonic: int
+    root: int
+    chord: Tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class SongHarmony:
+    sections: Tuple[SectionHarmony, ...]
+    roots: array  # chord root of every bar, in song order
+
+
+def plan_song_harmony(
+    profile: MusicProfile,
+    section_order: Sequence[Tuple[str, int]],
+    tonic: int
+) -> SongHarmony:
+    """
+    Chord roots and tones for a whole song, including the lift after each
+    chorus. Only the scale and whether the risk crosses the borrowing
+    threshold matter, so plans are shared across genres and energies.
+    """
+    risky = _risk(profile) > 0.6
+    with metrics.timer("harmony_plan"):
+        return _plan(profile.scale, risky, tonic, tuple((name, bars) for name, bars in section_order))
+
+
+@lru_cache(maxsize=256)
+def _plan(scale: str, risky: bool, tonic: int, section_order: Tuple[Tuple[str, int], ...]) -> SongHarmony:
+    sections = tuple(_iter_sections(scale, risky, tonic, section_order))
+    roots = array("B")
+    for part in sections:
+        roots.extend([part.root] * part.bars)
+    return SongHarmony(sections, roots)
+
+
+def iter_song_harmony(
+    profile: MusicProfile,
+    sections: Iterable[Tuple[str, int]],
+    tonic: int
+) -> Iterator[SectionHarmony]:
+    """
+    plan_song_harmony one section at a time, for section streams that are
+    too long (or endless) to plan up front.
+    """
+    return _iter_sections(profile.scale, _risk(profile) > 0.6, tonic, sections)
+
+
+def _iter_sections(scale: str, risky: bool, tonic: int, sections: Iterable[Tuple[str, int]]) -> Iterator[SectionHarmony]:
+    minor = scale != "major"
+    home = tonic
+
+    for name, bars in sections:
+        root = tonic + _chord_offset(scale, risky, name)
+        yield SectionHarmony(name, bars, tonic, root, chord_tones(root, minor))
+
+        if "Chorus" in name:
+            tonic += CHORUS_LIFT
+            if tonic - home >= 12:
+                tonic -= 12  # long songs keep lifting; stay within an octave of home
+
 
-    semitone = base.get(degree) or BORROWED.get(degree, 0)
-    return [ctx.tonic + semitone]
+def harmony_plan_stats() -> Dict[str, int]:
+    info = _plan.cache_info()
+    return {"size": info.currsize, "hits": info.hits, "misses": info.misses}
@@ -0,0 +1,211 @@
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+# MEUPHONIC_METRICS=0 turns every update into an early return
+ENABLED = os.getenv("MEUPHONIC_METRICS", "1") != "0"
+
+PREFIX = "meuphonic_"
+
+# Latency buckets shared by all per-stage timers (seconds)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 15.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _label_str(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str = "", labels: Labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def prometheus(self) -> List[str]:
+        return [f"{PREFIX}{self.name}{_label_str(self.labels)} {self.value}"]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; bucket bounds are inclusive upper limits.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, buckets: Sequence[float], help: str = "", labels: Labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if not ENABLED:
+            return
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def _cumulative(self) -> List[Tuple[str, int]]:
+        out = []
+        total = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            out.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return out
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.sum, "buckets": dict(self._cumulative())}
+
+    def prometheus(self) -> List[str]:
+        name = PREFIX + self.name
+        lines = []
+        for le, n in self._cumulative():
+            bound = 'le="%s"' % le
+            lines.append(f"{name}_bucket{_label_str(self.labels, bound)} {n}")
+        lines.append(f"{name}_sum{_label_str(self.labels)} {self.sum}")
+        lines.append(f"{name}_count{_label_str(self.labels)} {self.count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("stage", "histogram", "start")
+
+    def __init__(self, stage: str, histogram: Histogram):
+        self.stage = stage
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        self.histogram.observe(elapsed)
+        captured = getattr(_captured, "stages", None)
+        if captured is not None:
+            captured.append((self.stage, elapsed))
+        return False
+
+
+Metric = Union[Counter, Histogram]
+
+_registry: Dict[Tuple[str, Labels], Metric] = {}
+_registry_lock = threading.Lock()
+_stage_histograms: Dict[str, Histogram] = {}
+_NULL_TIMER = nullcontext()
+_captured = threading.local()
+
+
+def _register(name: str, labels: Dict[str, str], factory) -> Metric:
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        metric = _registry.get(key)
+        if metric is None:
+            metric = factory(key[1])
+            _registry[key] = metric
+        return metric
+
+
+def counter(name: str, help: str = "", **labels: str) -> Counter:
+    return _register(name, labels, lambda lb: Counter(name, help, lb))
+
+
+def histogram(name: str, buckets: Sequence[float], help: str = "", **labels: str) -> Histogram:
+    return _register(name, labels, lambda lb: Histogram(name, buckets, help, lb))
+
+
+def timer(stage: str):
+    """
+    Context manager recording wall time into stage_seconds{stage=...};
+    a shared no-op when metrics are disabled.
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage, _stage_histogram(stage))
+
+
+def _stage_histogram(stage: str) -> Histogram:
+    hist = _stage_histograms.get(stage)
+    if hist is None:
+        hist = histogram("stage_seconds", STAGE_BUCKETS, "Wall time per pipeline stage", stage=stage)
+        _stage_histograms[stage] = hist
+    return hist
+
+
+@contextmanager
+def capture_stages() -> Iterator[List[Tuple[str, float]]]:
+    """
+    Collects the (stage, seconds) of every timer that finishes in this thread
+    inside the block, so a worker process can hand them to its parent (see
+    observe_stages).
+    """
+    outer = getattr(_captured, "stages", None)
+    stages: List[Tuple[str, float]] = []
+    _captured.stages = stages
+    try:
+        yield stages
+    finally:
+        _captured.stages = outer
+        if outer is not None:
+            outer.extend(stages)
+
+
+def observe_stages(stages: Iterable[Tuple[str, float]]) -> None:
+    """
+    Records stage timings measured elsewhere, e.g. in a render worker.
+    """
+    if not ENABLED:
+        return
+    for stage, seconds in stages:
+        _stage_histogram(stage).observe(seconds)
+
+
+def snapshot() -> Dict[str, object]:
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {m.name + _label_str(m.labels): m.snapshot() for m in metrics}
+
+
+def render_prometheus() -> str:
+    """
+    Every registered metric in the Prometheus text exposition format.
+    """
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: (m.name, m.labels))
+
+    lines = []
+    seen = set()
+    for m in metrics:
+        if m.name not in seen:
+            seen.add(m.name)
+            lines.append(f"# HELP {PREFIX}{m.name} {m.help}")
+            lines.append(f"# TYPE {PREFIX}{m.name} {m.kind}")
+        lines.extend(m.prometheus())
+    return "\n".join(lines) + "\n"
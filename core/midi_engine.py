@@ -1,9 +1,16 @@
-from mido import MidiFile, MidiTrack, Message, MetaMessage, bpm2tempo
+import shutil
+import struct
+import tempfile
+from array import array
+from itertools import cycle
+from mido import bpm2tempo
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+from core import metrics
 from core.ai_music_brain import MusicProfile
-from core.harmony_engine import build_progression
-from core.groove_engine import groove_for_bar
+from core.harmony_engine import SectionHarmony, chord_tones, iter_song_harmony, plan_song_harmony
+from core.groove_engine import compiled_groove
 
 # General MIDI programs
 GM_PIANO = 0
@@ -12,6 +19,19 @@ GM_GUITAR = 29
 GM_STRINGS = 48
 GM_PAD = 89
 
+# Bump whenever the rendered bytes for a given profile change (keys render caches)
+RENDERER_VERSION = 1
+
+TICKS_PER_BEAT = 480
+DRUM_CH = 9
+
+# Channel message status bytes (channel is OR-ed into the low nibble)
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+PROGRAM_CHANGE = 0xC0
+
+TRACK_NAMES = ("chords", "bass", "melody", "pad", "drums")
+
 ROOTS = {"C": 60, "D": 62, "E": 64, "F": 65, "G": 67, "A": 69}
 
 SECTION_ORDER = [
@@ -27,7 +47,7 @@ SECTION_ORDER = [
 
 
 def chord_notes(root: int, minor: bool) -> List[int]:
-    return [root, root + (3 if minor else 4), root + 7]
+    return list(chord_tones(root, minor))
 
 
 def section_intensity(name: str) -> float:
@@ -42,83 +62,518 @@ def section_intensity(name: str) -> float:
     return 0.6
 
 
-def render_to_midi(profile: MusicProfile, output_path: str) -> str:
-    mid = MidiFile()
-    ticks = mid.ticks_per_beat
-    bar_ticks = ticks * 4
+class EventBuffer:
+    """
+    Column store for one track's channel events: absolute tick, status byte
+    and up to two data bytes per event.
+    """
+
+    __slots__ = ("ticks", "status", "data1", "data2")
+
+    def __init__(self):
+        self.ticks = array("I")
+        self.status = array("B")
+        self.data1 = array("B")
+        self.data2 = array("B")
+
+    def add(self, tick: int, status: int, data1: int, data2: int = 0) -> None:
+        self.ticks.append(tick)
+        self.status.append(status)
+        self.data1.append(data1)
+        self.data2.append(data2)
+
+    def clear(self) -> None:
+        del self.ticks[:], self.status[:], self.data1[:], self.data2[:]
+
+    def __len__(self) -> int:
+        return len(self.ticks)
+
+
+def _write_vlq(out: bytearray, value: int) -> None:
+    if value < 0x80:
+        out.append(value)
+        return
+    stack = [value & 0x7F]
+    value >>= 7
+    while value:
+        stack.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.extend(reversed(stack))
+
+
+class _TrackEncoder:
+    """
+    Incremental MTrk body encoder. Feed buffers in tick order (each buffer's
+    events may be unsorted, but must not precede what was already fed);
+    encoded bytes accumulate in `out`, which callers may drain at any time.
+    `prelude` holds already-encoded events at tick 0 (e.g. meta events).
+    """
+
+    def __init__(self, prelude: bytes = b""):
+        self.out = bytearray(prelude)
+        self.running = None  # meta events in the prelude cancel running status
+        self.last = 0
+
+    def feed(self, buf: EventBuffer) -> None:
+        out = self.out
+        ticks, status, data1, data2 = buf.ticks, buf.status, buf.data1, buf.data2
+        running, last = self.running, self.last
+
+        for i in sorted(range(len(ticks)), key=ticks.__getitem__):
+            tick = ticks[i]
+            _write_vlq(out, tick - last)
+            last = tick
+
+            st = status[i]
+            if st != running:
+                out.append(st)
+                running = st
+            out.append(data1[i])
+            if st & 0xF0 not in (0xC0, 0xD0):  # program change / channel pressure have one data byte
+                out.append(data2[i])
+
+        self.running, self.last = running, last
+
+    def finish(self) -> None:
+        self.out += b"\x00\xff\x2f\x00"
+
+
+def _encode_track(buf: EventBuffer, prelude: bytes = b"") -> bytes:
+    """
+    Serializes one track as an MTrk chunk: events are ordered by tick (stable),
+    written as delta times with running status, and closed by end_of_track.
+    """
+    enc = _TrackEncoder(prelude)
+    enc.feed(buf)
+    enc.finish()
+    return b"MTrk" + struct.pack(">I", len(enc.out)) + bytes(enc.out)
+
 
-    chord_track = MidiTrack()
-    bass_track = MidiTrack()
-    melody_track = MidiTrack()
-    pad_track = MidiTrack()
-    drum_track = MidiTrack()
+def _header(ntracks: int) -> bytes:
+    return b"MThd" + struct.pack(">IHHH", 6, 1, ntracks, TICKS_PER_BEAT)
 
-    mid.tracks.extend([chord_track, bass_track, melody_track, pad_track, drum_track])
 
-    DRUM_CH = 9
+def _tempo_meta(bpm: int) -> bytes:
+    return b"\x00\xff\x51\x03" + bpm2tempo(bpm).to_bytes(3, "big")
 
-    chord_track.append(MetaMessage("set_tempo", tempo=bpm2tempo(profile.tempo), time=0))
+
+def new_tracks() -> List[EventBuffer]:
+    """
+    Empty buffers for TRACK_NAMES, with each part's instrument set at tick 0.
+    """
+    tracks = [EventBuffer() for _ in TRACK_NAMES]
+    chord_track, bass_track, melody_track, pad_track, _ = tracks
 
     # Instruments
-    chord_track.append(Message("program_change", program=GM_PIANO, time=0))
-    bass_track.append(Message("program_change", program=GM_BASS, time=0))
-    melody_track.append(Message("program_change", program=GM_GUITAR, time=0))
-    pad_track.append(Message("program_change", program=GM_PAD, time=0))
-
-    root_note = ROOTS.get("A", 60)
-    minor = profile.scale != "major"
-
-    abs_tick = 0
-
-    for section, bars in SECTION_ORDER:
-        intensity = section_intensity(section)
-        velocity = int(45 + intensity * 45)
-
-        for _ in range(bars):
-            # --- HARMONY ---
-            roots = build_progression(profile, section, root_note)
-            notes = chord_notes(roots[0], minor)
-
-            chord_track.append(Message("note_on", note=notes[0], velocity=velocity, time=abs_tick))
-            for n in notes[1:]:
-                chord_track.append(Message("note_on", note=n, velocity=velocity, time=0))
-            for i, n in enumerate(notes):
-                chord_track.append(Message("note_off", note=n, velocity=0, time=bar_ticks if i == 0 else 0))
-
-            # --- BASS ---
-            if intensity > 0.45:
-                bass_track.append(Message("note_on", note=roots[0] - 12, velocity=velocity, time=abs_tick))
-                bass_track.append(Message("note_off", note=roots[0] - 12, velocity=0, time=bar_ticks))
-
-            # --- MELODY (PHRASED) ---
-            if intensity > 0.65:
-                melody_track.append(
-                    Message("note_on", note=roots[0] + 12, velocity=velocity + 10, time=abs_tick)
-                )
-                melody_track.append(
-                    Message("note_off", note=roots[0] + 12, velocity=0, time=int(bar_ticks * 0.75))
-                )
-
-            # --- DRUMS ---
-            events = groove_for_bar(profile.genre, section, profile.energy)
-            last = 0
-            for note, beat, vel in sorted(events, key=lambda x: x[1]):
-                t = int(beat * ticks)
-                drum_track.append(
-                    Message("note_on", channel=DRUM_CH, note=note, velocity=vel, time=max(0, t - last))
-                )
-                drum_track.append(
-                    Message("note_off", channel=DRUM_CH, note=note, velocity=0, time=int(0.1 * ticks))
-                )
-                last = t + int(0.1 * ticks)
-
-            abs_tick = 0  # reset for next bar; MIDI deltas handled above
-
-        if "Chorus" in section:
-            root_note += 2  # lift
-
-    out = Path(output_path)
-    out.parent.mkdir(exist_ok=True)
-    mid.save(out)
+    chord_track.add(0, PROGRAM_CHANGE, GM_PIANO)
+    bass_track.add(0, PROGRAM_CHANGE, GM_BASS)
+    melody_track.add(0, PROGRAM_CHANGE, GM_GUITAR)
+    pad_track.add(0, PROGRAM_CHANGE, GM_PAD)
+    return tracks
+
+
+def iter_render(
+    profile: MusicProfile,
+    tracks: List[EventBuffer],
+    section_order: Iterable[Tuple[str, int]] = SECTION_ORDER,
+    tonic: Optional[int] = None,
+    progression: Optional[Sequence[Tuple[int, bool]]] = None,
+    groove_energy: Optional[float] = None
+) -> Iterator[Tuple[str, int]]:
+    """
+    Renders the song bar by bar into `tracks` (see new_tracks), yielding
+    (section, bar index) after each bar. Consumers may read and clear the
+    buffers between bars; ticks stay absolute. `section_order` may be any
+    iterable, including a generator of unbounded length.
+
+    The optional arguments make variations of the song: another home note
+    (default A), a progression of (offset, minor) chords cycled bar by bar
+    in place of one chord per section (see progression_offsets), and the
+    energy the drums are played with (default the profile's).
+    """
+    if tonic is None:
+        tonic = ROOTS.get("A", 60)
+    energy = profile.energy if groove_energy is None else groove_energy
+    if isinstance(section_order, (list, tuple)):
+        sections = plan_song_harmony(profile, section_order, tonic).sections
+    else:
+        sections = iter_song_harmony(profile, section_order, tonic)
+
+    # Each track keeps its own clock; parts only advance when they play
+    clocks = [0, 0, 0, 0]
+    bar_index = 0
+
+    for part in sections:
+        for _ in _iter_section_bars(part, profile.genre, energy, tracks, clocks, progression):
+            yield part.name, bar_index
+            bar_index += 1
+
+
+def _iter_section_bars(
+    part: SectionHarmony,
+    genre: str,
+    energy: float,
+    tracks: List[EventBuffer],
+    clocks: List[int],
+    progression: Optional[Sequence[Tuple[int, bool]]] = None
+) -> Iterator[None]:
+    """
+    Renders one section into `tracks`, yielding after each bar. `clocks`
+    holds the chord, bass, melody and drum clocks the section starts at and
+    is advanced in place.
+    """
+    ticks = TICKS_PER_BEAT
+    bar_ticks = ticks * 4
+    hit_ticks = int(0.1 * ticks)
+
+    chord_track, bass_track, melody_track, _, drum_track = tracks
+    chord_t, bass_t, melody_t, drum_t = clocks
+
+    section = part.name
+    intensity = section_intensity(section)
+    velocity = int(45 + intensity * 45)
+    root = part.root
+    notes = part.chord
+
+    for bar in range(part.bars):
+        if progression:
+            offset, minor = progression[bar % len(progression)]
+            root = part.tonic + offset
+            notes = chord_tones(root, minor)
+
+        # --- HARMONY ---
+        for n in notes:
+            chord_track.add(chord_t, NOTE_ON, n, velocity)
+        chord_t += bar_ticks
+        for n in notes:
+            chord_track.add(chord_t, NOTE_OFF, n, 0)
+
+        # --- BASS ---
+        if intensity > 0.45:
+            bass_track.add(bass_t, NOTE_ON, root - 12, velocity)
+            bass_t += bar_ticks
+            bass_track.add(bass_t, NOTE_OFF, root - 12, 0)
+
+        # --- MELODY (PHRASED) ---
+        if intensity > 0.65:
+            melody_track.add(melody_t, NOTE_ON, root + 12, velocity + 10)
+            melody_t += int(bar_ticks * 0.75)
+            melody_track.add(melody_t, NOTE_OFF, root + 12, 0)
+
+        # --- DRUMS ---
+        groove = compiled_groove(genre, section, energy, ticks, hit_ticks)
+        for start, note, vel in zip(groove.starts, groove.notes, groove.velocities):
+            drum_track.add(drum_t + start, NOTE_ON | DRUM_CH, note, vel)
+            drum_track.add(drum_t + start + hit_ticks, NOTE_OFF | DRUM_CH, note, 0)
+        drum_t += groove.length
+
+        clocks[:] = chord_t, bass_t, melody_t, drum_t
+        yield
+
+
+@dataclass
+class BarEvents:
+    section: str
+    bar: int
+    # (track index, absolute tick, status, data1, data2), ordered by tick
+    events: List[Tuple[int, int, int, int, int]]
+
+
+def iter_bar_events(
+    profile: MusicProfile,
+    section_order: Iterable[Tuple[str, int]] = SECTION_ORDER
+) -> Iterator[BarEvents]:
+    """
+    The song as it is rendered: one BarEvents per bar, produced as soon as the
+    bar is done. Memory stays at one bar's worth of events.
+    """
+    tracks = new_tracks()
+    for section, bar in iter_render(profile, tracks, section_order):
+        events = []
+        for i, buf in enumerate(tracks):
+            events.extend(zip([i] * len(buf), buf.ticks, buf.status, buf.data1, buf.data2))
+            buf.clear()
+        events.sort(key=lambda e: e[1])
+        yield BarEvents(section, bar, events)
+
+
+def _build_tracks(profile: MusicProfile, **variation) -> List[EventBuffer]:
+    tracks = new_tracks()
+    for _ in iter_render(profile, tracks, SECTION_ORDER, **variation):
+        pass
+    return tracks
+
+
+def render_to_midi(profile: MusicProfile, output_path: str) -> str:
+    data = render_to_midi_bytes(profile)
+
+    with metrics.timer("disk_write"):
+        out = Path(output_path)
+        out.parent.mkdir(exist_ok=True)
+        out.write_bytes(data)
     return str(out)
 
+
+def render_to_midi_bytes(profile: MusicProfile, **variation) -> bytes:
+    """
+    Renders the song straight into memory (no filesystem access).
+    `variation` takes iter_render's tonic / progression / groove_energy.
+    """
+    with metrics.timer("render_events"):
+        tracks = _build_tracks(profile, **variation)
+
+    with metrics.timer("serialize"):
+        out = bytearray(_header(len(tracks)))
+        out += _encode_track(tracks[0], prelude=_tempo_meta(profile.tempo))
+        for track in tracks[1:]:
+            out += _encode_track(track)
+        return bytes(out)
+
+
+# ---------------- STREAMING WRITER ----------------
+
+def repeat_sections(total_bars: int, order: Sequence[Tuple[str, int]] = SECTION_ORDER) -> Iterator[Tuple[str, int]]:
+    """
+    Cycles `order` until `total_bars` bars have been produced (the last
+    section is shortened to fit).
+    """
+    remaining = total_bars
+    for name, bars in cycle(order):
+        if remaining <= 0:
+            return
+        bars = min(bars, remaining)
+        yield name, bars
+        remaining -= bars
+
+
+def write_midi_stream(
+    profile: MusicProfile,
+    out: BinaryIO,
+    sections: Optional[Callable[[], Iterable[Tuple[str, int]]]] = None
+) -> int:
+    """
+    Writes the song as a Standard MIDI File to `out` in constant memory,
+    however many bars `sections()` yields. Tracks are written one at a time
+    (the bar generator is re-run for each) and flushed bar by bar; chunk
+    lengths are back-patched on seekable outputs and spooled through a
+    temporary file otherwise (sockets, pipes). Returns bytes written.
+    """
+    make_sections = sections or (lambda: SECTION_ORDER)
+
+    header = _header(len(TRACK_NAMES))
+    out.write(header)
+    written = len(header)
+
+    try:
+        seekable = out.seekable()
+    except AttributeError:
+        seekable = False
+
+    for index in range(len(TRACK_NAMES)):
+        written += _stream_track(profile, index, make_sections(), out, seekable)
+    return written
+
+
+def _stream_track(
+    profile: MusicProfile,
+    index: int,
+    sections: Iterable[Tuple[str, int]],
+    out: BinaryIO,
+    seekable: bool
+) -> int:
+    enc = _TrackEncoder(_tempo_meta(profile.tempo) if index == 0 else b"")
+    target = out if seekable else tempfile.TemporaryFile()
+    try:
+        chunk_start = target.tell()
+        target.write(b"MTrk\x00\x00\x00\x00")
+        length = 0
+
+        tracks = new_tracks()
+        for _ in iter_render(profile, tracks, sections):
+            enc.feed(tracks[index])
+            for buf in tracks:
+                buf.clear()
+            target.write(enc.out)
+            length += len(enc.out)
+            enc.out.clear()
+
+        enc.finish()
+        target.write(enc.out)
+        length += len(enc.out)
+
+        if seekable:
+            end = target.tell()
+            target.seek(chunk_start + 4)
+            target.write(struct.pack(">I", length))
+            target.seek(end)
+        else:
+            out.write(b"MTrk" + struct.pack(">I", length))
+            target.seek(chunk_start + 8)
+            shutil.copyfileobj(target, out)
+    finally:
+        if target is not out:
+            target.close()
+
+    return length + 8
+
+
+# ---------------- SECTION EDITING ----------------
+
+@dataclass(frozen=True)
+class _TrackBlock:
+    """
+    One track's events within one section, encoded relative to the section
+    start. The first event's delta time and status byte are left out of
+    `body`; they depend on what precedes the block and are written when
+    blocks are spliced.
+    """
+    body: bytes
+    first_tick: int
+    first_status: int
+    last_tick: int
+    last_status: int
+    advance: int  # how far the section moves this track's clock
+    events: int
+
+
+@dataclass(frozen=True)
+class SectionBlock:
+    harmony: SectionHarmony
+    genre: str
+    energy: float
+    tracks: Tuple[_TrackBlock, ...]
+
+
+def _encode_block(buf: EventBuffer, advance: int) -> _TrackBlock:
+    if not len(buf):
+        return _TrackBlock(b"", 0, 0, 0, 0, advance, 0)
+
+    enc = _TrackEncoder()
+    enc.feed(buf)
+    if enc.last > advance:
+        raise ValueError("section events run past the end of the section")
+    first = min(range(len(buf)), key=buf.ticks.__getitem__)
+    first_tick = buf.ticks[first]
+    delta = bytearray()
+    _write_vlq(delta, first_tick)
+    body = bytes(enc.out[len(delta) + 1:])
+    return _TrackBlock(body, first_tick, buf.status[first], enc.last, enc.running, advance, len(buf))
+
+
+def render_section(part: SectionHarmony, genre: str, energy: float) -> SectionBlock:
+    """
+    Renders one section on its own, every track starting at tick 0.
+    """
+    tracks = [EventBuffer() for _ in TRACK_NAMES]
+    clocks = [0, 0, 0, 0]
+    for _ in _iter_section_bars(part, genre, energy, tracks, clocks):
+        pass
+
+    chord_t, bass_t, melody_t, drum_t = clocks
+    advances = (chord_t, bass_t, melody_t, 0, drum_t)
+    return SectionBlock(part, genre, energy, tuple(_encode_block(b, a) for b, a in zip(tracks, advances)))
+
+
+class EditableSong:
+    """
+    A rendered song kept as one encoded block per section. Editing a section
+    re-renders that section only (plus any later one whose harmony the edit
+    moves, e.g. adding a chorus shifts the key lift of what follows) and
+    to_bytes() splices the blocks, fixing up the delta time and running
+    status where they meet. Unedited, it produces the same bytes as a full
+    render of `section_order`.
+    """
+
+    def __init__(self, profile: MusicProfile, section_order: Sequence[Tuple[str, int]] = SECTION_ORDER):
+        self.profile = profile
+        self.sections: List[Tuple[str, int]] = list(section_order)
+        # groove genre and energy per section; edits may override the profile's
+        self._grooves: List[Tuple[str, float]] = [(profile.genre, profile.energy)] * len(self.sections)
+        self.blocks: List[SectionBlock] = []
+        self._sync()
+
+    def _sync(self) -> int:
+        """
+        Brings `blocks` in line with `sections`, rendering only the sections
+        that differ from an existing block. Returns how many were rendered.
+        """
+        plan = plan_song_harmony(self.profile, self.sections, ROOTS.get("A", 60)).sections
+        existing = {(b.harmony, b.genre, b.energy): b for b in self.blocks}
+
+        blocks, rendered = [], 0
+        for part, (genre, energy) in zip(plan, self._grooves):
+            block = existing.get((part, genre, energy))
+            if block is None:
+                block = render_section(part, genre, energy)
+                rendered += 1
+            blocks.append(block)
+
+        self.blocks = blocks
+        return rendered
+
+    def edit(
+        self,
+        index: int,
+        name: Optional[str] = None,
+        bars: Optional[int] = None,
+        genre: Optional[str] = None,
+        energy: Optional[float] = None
+    ) -> int:
+        """
+        Changes section `index` (its name, length, or the genre and energy
+        its drums are played with) and re-renders what the change affects.
+        Returns the number of sections rendered.
+        """
+        old_name, old_bars = self.sections[index]
+        old_genre, old_energy = self._grooves[index]
+        if bars is not None and bars < 1:
+            raise ValueError("a section needs at least one bar")
+
+        self.sections[index] = (old_name if name is None else name, old_bars if bars is None else bars)
+        self._grooves[index] = (old_genre if genre is None else genre, old_energy if energy is None else energy)
+        with metrics.timer("render_section"):
+            return self._sync()
+
+    def insert(self, index: int, name: str, bars: int) -> int:
+        self.sections.insert(index, (name, bars))
+        self._grooves.insert(index, (self.profile.genre, self.profile.energy))
+        with metrics.timer("render_section"):
+            return self._sync()
+
+    def remove(self, index: int) -> int:
+        del self.sections[index]
+        del self._grooves[index]
+        with metrics.timer("render_section"):
+            return self._sync()
+
+    def to_bytes(self) -> bytes:
+        with metrics.timer("serialize"):
+            heads = new_tracks()
+            out = bytearray(_header(len(heads)))
+
+            for index, head in enumerate(heads):
+                enc = _TrackEncoder(_tempo_meta(self.profile.tempo) if index == 0 else b"")
+                enc.feed(head)  # program change at tick 0
+                body, running, pending = enc.out, enc.running, 0
+
+                for block in self.blocks:
+                    track = block.tracks[index]
+                    if not track.events:
+                        pending += track.advance
+                        continue
+                    _write_vlq(body, pending + track.first_tick)
+                    if track.first_status != running:
+                        body.append(track.first_status)
+                    body += track.body
+                    running = track.last_status
+                    pending = track.advance - track.last_tick
+
+                enc.finish()
+                out += b"MTrk" + struct.pack(">I", len(body)) + body
+            return bytes(out)
+
+    def write(self, output_path: str) -> str:
+        out = Path(output_path)
+        out.parent.mkdir(exist_ok=True)
+        out.write_bytes(self.to_bytes())
+        return str(out)
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from core import metrics
+from core.ai_music_brain import MusicProfile
+
+PROFILE_STORE_SIZE = int(os.getenv("MEUPHONIC_PROFILE_STORE_SIZE", "1024"))
+PROFILE_TTL_S = float(os.getenv("MEUPHONIC_PROFILE_TTL_S", "3600"))
+
+_hits = metrics.counter("profile_store_hits_total", "Profiles served without re-analysis")
+_misses = metrics.counter("profile_store_misses_total", "Lookups that required a fresh analysis")
+
+
+def normalize_description(description: str) -> str:
+    return " ".join(description.lower().split())
+
+
+class ProfileStore:
+    """
+    Bounded LRU of analyzed profiles with a time-to-live. Entries are
+    addressable by an opaque profile id or by the normalized description
+    that produced them.
+    """
+
+    def __init__(self, max_size: int = PROFILE_STORE_SIZE, ttl: float = PROFILE_TTL_S):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        # profile_id -> (profile, expires_at, normalized description)
+        self._by_id: "OrderedDict[str, Tuple[MusicProfile, float, str]]" = OrderedDict()
+        self._by_text: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def put(self, description: str, profile: MusicProfile) -> str:
+        key = normalize_description(description)
+        with self._lock:
+            profile_id = self._by_text.get(key) or uuid.uuid4().hex
+            self._by_id[profile_id] = (profile, time.monotonic() + self.ttl, key)
+            self._by_id.move_to_end(profile_id)
+            self._by_text[key] = profile_id
+
+            while len(self._by_id) > self.max_size:
+                old_id, (_, _, old_key) = self._by_id.popitem(last=False)
+                if self._by_text.get(old_key) == old_id:
+                    del self._by_text[old_key]
+
+        return profile_id
+
+    def get(self, profile_id: str, description: Optional[str] = None) -> Optional[MusicProfile]:
+        """
+        The profile stored under `profile_id`; when `description` is given,
+        only if that id was analyzed from the same (normalized) text.
+        """
+        with self._lock:
+            entry = self._live(profile_id)
+        if entry is not None and description is not None and entry[2] != normalize_description(description):
+            entry = None
+        if entry is None:
+            _misses.inc()
+            return None
+        _hits.inc()
+        return entry[0]
+
+    def find(self, description: str) -> Optional[Tuple[str, MusicProfile]]:
+        with self._lock:
+            profile_id = self._by_text.get(normalize_description(description))
+            entry = self._live(profile_id) if profile_id else None
+        if entry is None:
+            _misses.inc()
+            return None
+        _hits.inc()
+        return profile_id, entry[0]
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _live(self, profile_id: str):
+        # caller holds the lock
+        entry = self._by_id.get(profile_id)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._by_id[profile_id]
+            if self._by_text.get(entry[2]) == profile_id:
+                del self._by_text[entry[2]]
+            return None
+        self._by_id.move_to_end(profile_id)
+        return entry
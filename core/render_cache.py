@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from core import metrics
+from core.ai_music_brain import MusicProfile
+from core.midi_engine import RENDERER_VERSION
+
+RENDER_CACHE_DIR = os.getenv("MEUPHONIC_RENDER_CACHE_DIR", "outputs/render_cache")
+RENDER_CACHE_MAX_BYTES = int(os.getenv("MEUPHONIC_RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_hits = metrics.counter("render_cache_hits_total", "Renders served from the on-disk cache")
+_misses = metrics.counter("render_cache_misses_total", "Renders that had to be computed")
+_evictions = metrics.counter("render_cache_evictions_total", "Cached renders evicted to stay under budget")
+
+
+def profile_key(profile: MusicProfile) -> str:
+    """
+    Stable content hash of everything that determines the rendered bytes.
+    """
+    payload = json.dumps({"renderer": RENDERER_VERSION, **asdict(profile)}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RenderCache:
+    """
+    Content-addressed MIDI files under `root`, evicted least-recently-used
+    once their total size exceeds `max_bytes`. Recency is kept in file
+    mtimes so it survives restarts; files are written atomically, so
+    several processes can share one directory.
+    """
+
+    def __init__(self, root: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._bytes = 0
+
+        found = []
+        for path in self.root.glob("*/*.mid"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            found.append((st.st_mtime, path.stem, st.st_size))
+        for _, key, size in sorted(found):
+            self._index[key] = size
+            self._bytes += size
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.mid"
+
+    def get(self, profile: MusicProfile) -> Optional[bytes]:
+        key = profile_key(profile)
+        path = self._path(key)
+        try:
+            with metrics.timer("render_cache_read"):
+                data = path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+            _misses.inc()
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            if key not in self._index:
+                # written by another process sharing the directory
+                self._bytes += len(data)
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+
+        _hits.inc()
+        return data
+
+    def put(self, profile: MusicProfile, data: bytes) -> None:
+        key = profile_key(profile)
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with metrics.timer("render_cache_write"), os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            self._forget(key)
+            self._index[key] = len(data)
+            self._bytes += len(data)
+            self._evict()
+
+    def get_or_render(self, profile: MusicProfile, render: Callable[[MusicProfile], bytes]) -> bytes:
+        data = self.get(profile)
+        if data is None:
+            data = render(profile)
+            self.put(profile, data)
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._index),
+            "bytes": self._bytes,
+            "hits": _hits.value,
+            "misses": _misses.value,
+            "evictions": _evictions.value,
+        }
+
+    def _forget(self, key: str) -> None:
+        # caller holds the lock
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _evict(self) -> None:
+        # caller holds the lock
+        while self._bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+            _evictions.inc()
@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+from core import metrics
+from core.ai_music_brain import MusicProfile
+from core.midi_engine import render_to_midi_bytes
+from core.variants import Variant, render_variant
+
+# 0 renders on the thread pool of the calling process instead
+RENDER_WORKERS = int(os.getenv("MEUPHONIC_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+RENDER_QUEUE_DEPTH = int(os.getenv("MEUPHONIC_RENDER_QUEUE_DEPTH", "64"))
+
+_rejected = metrics.counter("render_pool_rejected_total", "Renders refused because the queue was full")
+_latency = metrics.histogram(
+    "render_pool_seconds", (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    "Queue wait plus render time per song",
+)
+
+
+class RenderPoolBusy(RuntimeError):
+    pass
+
+
+def _warm_worker() -> None:
+    # fills the groove / harmony tables once per worker
+    render_to_midi_bytes(MusicProfile(genre="pop", tempo=100, scale="major", energy=0.5))
+
+
+def _noop() -> None:
+    pass
+
+
+def _timed(fn, *args):
+    # runs in a worker: its stage timers would otherwise only reach the
+    # worker's own registry, which nobody scrapes
+    with metrics.capture_stages() as stages:
+        result = fn(*args)
+    return result, stages
+
+
+class RenderPool:
+    """
+    Renders songs in worker processes so the CPU-bound renderer does not hold
+    the web process's GIL. Workers receive a MusicProfile and return MIDI
+    bytes; at most `max_queue` renders may be queued or running at once.
+    """
+
+    def __init__(self, workers: int = RENDER_WORKERS, max_queue: int = RENDER_QUEUE_DEPTH):
+        self.workers = max(0, workers)
+        self.max_queue = max(1, max_queue)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+
+    def start(self) -> None:
+        if self.workers == 0 or self._executor is not None:
+            return
+        # forkserver/spawn children start clean: no copy of the web process,
+        # its threads or the embedding model
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=ctx, initializer=_warm_worker
+        )
+        for _ in range(self.workers):
+            self._executor.submit(_noop)  # bring every worker up now, not on first request
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _reserve(self, n: int) -> None:
+        if self._in_flight + n > self.max_queue:
+            _rejected.inc()
+            raise RenderPoolBusy(f"{self._in_flight} renders already queued")
+        self._in_flight += n
+
+    async def _run(self, fn, *args) -> bytes:
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            if self._executor is None:
+                # on a thread of this process the timers record directly
+                return await loop.run_in_executor(None, fn, *args)
+            result, stages = await loop.run_in_executor(self._executor, _timed, fn, *args)
+            metrics.observe_stages(stages)
+            return result
+        finally:
+            self._in_flight -= 1
+            _latency.observe(time.perf_counter() - start)
+
+    async def render(self, profile: MusicProfile) -> bytes:
+        self._reserve(1)
+        return await self._run(render_to_midi_bytes, profile)
+
+    async def render_variants(self, profile: MusicProfile, variants: Sequence[Variant]) -> List[bytes]:
+        """
+        Renders all variants side by side across the workers. The whole set
+        is admitted or refused at once.
+        """
+        self._reserve(len(variants))
+        return list(await asyncio.gather(*(self._run(render_variant, profile, v) for v in variants)))
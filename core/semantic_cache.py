@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from core import metrics
+
+SEMANTIC_CACHE_SIZE = int(os.getenv("MEUPHONIC_SEMANTIC_CACHE_SIZE", "4096"))
+# Cosine similarity above which two descriptions count as the same prompt
+SEMANTIC_THRESHOLD = float(os.getenv("MEUPHONIC_SEMANTIC_THRESHOLD", "0.9"))
+# Entries from which lookups switch from a full scan to the partitioned index;
+# must stay below the cache size, which the index never grows past
+SEMANTIC_IVF_MIN = int(os.getenv("MEUPHONIC_SEMANTIC_IVF_MIN", "2048"))
+SEMANTIC_NPROBE = int(os.getenv("MEUPHONIC_SEMANTIC_NPROBE", "8"))
+
+_hits = metrics.counter("semantic_cache_hits_total", "Descriptions answered by a near-duplicate's result")
+_misses = metrics.counter("semantic_cache_misses_total", "Descriptions with no near-duplicate in the index")
+_lookup_seconds = metrics.histogram(
+    "semantic_cache_lookup_seconds",
+    (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01),
+    "Nearest-neighbor lookup time",
+)
+
+V = TypeVar("V")
+
+
+class SemanticCache(Generic[V]):
+    """
+    Nearest-neighbor index over the embeddings of recent descriptions. A
+    lookup returns the value stored for the most similar description when
+    the cosine similarity reaches `threshold`.
+
+    Vectors live in a fixed ring of `max_entries` rows, the oldest being
+    overwritten first. Small indexes are searched with one matrix-vector
+    product; from `ivf_min` entries on, rows are partitioned around k-means
+    centroids and only the `nprobe` closest partitions are scanned.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        threshold: float = SEMANTIC_THRESHOLD,
+        ivf_min: int = SEMANTIC_IVF_MIN,
+        nprobe: int = SEMANTIC_NPROBE,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.threshold = threshold
+        self.ivf_min = ivf_min
+        self.nprobe = max(1, nprobe)
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # max_entries x dim, rows normalized
+        self._values: List[Any] = [None] * self.max_entries
+        self._size = 0
+        self._next = 0  # ring position of the next insert
+
+        # IVF partitions: centroids and the partition of every row
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.full(self.max_entries, -1, dtype=np.int32)
+        self._trained_at = 0
+        self._training = False
+        self._writes = 0      # adds so far, to find rows written during training
+        self._generation = 0  # bumped when the vectors are reset
+
+        self._hits = 0
+        self._misses = 0
+        self._lookup_total = 0.0
+
+    # ---- search ----
+
+    def _candidates(self, vec: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Rows to scan for `vec`, or None to scan them all.
+        """
+        if self._centroids is None:
+            return None
+        probes = np.argsort(self._centroids @ vec)[-self.nprobe:]
+        return np.nonzero(np.isin(self._assign[:self._size], probes))[0]
+
+    def _search(self, vec: np.ndarray) -> Tuple[int, float]:
+        rows = self._candidates(vec)
+        if rows is None:
+            sims = self._vectors[:self._size] @ vec
+            best = int(np.argmax(sims))
+            return best, float(sims[best])
+        if not len(rows):
+            return -1, -1.0
+        sims = self._vectors[rows] @ vec
+        best = int(np.argmax(sims))
+        return int(rows[best]), float(sims[best])
+
+    def lookup(self, vec: np.ndarray) -> Optional[Tuple[V, float]]:
+        """
+        (value, similarity) of the closest stored description, if it is
+        similar enough.
+        """
+        start = time.perf_counter()
+        vec = _normalized(vec)
+        with self._lock:
+            found = None
+            if self._size and self._vectors is not None and self._vectors.shape[1] == len(vec):
+                row, sim = self._search(vec)
+                if row >= 0 and sim >= self.threshold:
+                    found = self._values[row], sim
+
+            elapsed = time.perf_counter() - start
+            self._lookup_total += elapsed
+            if found is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+
+        _lookup_seconds.observe(elapsed)
+        (_misses if found is None else _hits).inc()
+        return found
+
+    # ---- updates ----
+
+    def add(self, vec: np.ndarray, value: V) -> None:
+        vec = _normalized(vec)
+        train = None
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vec):
+                self._reset(np.zeros((self.max_entries, len(vec)), dtype=np.float32))
+
+            row = self._next
+            self._vectors[row] = vec
+            self._values[row] = value
+            self._next = (row + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+            self._writes += 1
+
+            if self._centroids is not None:
+                self._assign[row] = int(np.argmax(self._centroids @ vec))
+            # (re)partition once the index is big enough, and again each time it doubles
+            if not self._training and self._size >= self.ivf_min and self._size >= 2 * self._trained_at:
+                self._training = True
+                self._trained_at = self._size
+                train = (self._vectors, self._size, self._writes, self._next, self._generation)
+
+        if train is not None:
+            # k-means takes long enough to stall every lookup if run under
+            # the lock; train on the rows as they are and swap the result in
+            threading.Thread(target=self._train, args=train, name="semantic-cache-ivf", daemon=True).start()
+
+    def _train(self, vectors: np.ndarray, size: int, writes: int, next_row: int, generation: int) -> None:
+        """
+        Spherical k-means over the first `size` rows, about sqrt(n)
+        partitions. Rows overwritten meanwhile are read as they are now and
+        reassigned when the partitions are swapped in.
+        """
+        try:
+            data = vectors[:size]
+            k = max(1, int(np.sqrt(size)))
+            rng = np.random.default_rng(0)
+            centroids = data[rng.choice(size, k, replace=False)].copy()
+
+            for _ in range(8):
+                assign = np.argmax(data @ centroids.T, axis=1)
+                for c in range(k):
+                    members = data[assign == c]
+                    if len(members):
+                        centroids[c] = _normalized(members.sum(axis=0))
+            assign = np.argmax(data @ centroids.T, axis=1)
+        except BaseException:
+            with self._lock:
+                self._training = False
+            raise
+
+        with self._lock:
+            self._training = False
+            if generation != self._generation:
+                return  # cleared or re-dimensioned while training
+            self._centroids = centroids
+            self._assign[:size] = assign
+
+            # rows added or overwritten since the snapshot
+            changed = min(self._writes - writes, self.max_entries)
+            if changed:
+                rows = (next_row + np.arange(changed)) % self.max_entries
+                rows = rows[rows < self._size]
+                self._assign[rows] = np.argmax(self._vectors[rows] @ centroids.T, axis=1)
+
+    def _reset(self, vectors: Optional[np.ndarray]) -> None:
+        self._vectors = vectors
+        self._values = [None] * self.max_entries
+        self._size = self._next = 0
+        self._centroids = None
+        self._trained_at = 0
+        self._generation += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset(None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": self._size,
+                "mode": "brute" if self._centroids is None else f"ivf({len(self._centroids)} lists, nprobe {self.nprobe})",
+                "threshold": self.threshold,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "mean_lookup_ms": 1000 * self._lookup_total / lookups if lookups else 0.0,
+            }
+
+
+def _normalized(vec: np.ndarray) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32)
+    return vec / max(float(np.linalg.norm(vec)), 1e-12)
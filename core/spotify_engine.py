@@ -1,10 +1,21 @@
 import os
+import json
 import time
 import base64
+import tempfile
+import asyncio
+import threading
+import httpx
 import requests
-from dataclasses import dataclass
-from typing import List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from core import metrics
 
 load_dotenv()
 
@@ -12,9 +23,76 @@ CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 MARKET = os.getenv("SPOTIFY_MARKET", "US")
 
+# Keep-alive connections kept per host, and how early (seconds) a token is refreshed
+POOL_SIZE = int(os.getenv("SPOTIFY_POOL_SIZE", "10"))
+TOKEN_REFRESH_MARGIN = float(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", "60"))
+
+# Response cache: freshness per endpoint, how long an expired entry may still be
+# served while it is refreshed in the background, and an optional snapshot file
+ARTIST_TTL = float(os.getenv("SPOTIFY_ARTIST_TTL", "3600"))
+RECOMMEND_TTL = float(os.getenv("SPOTIFY_RECOMMEND_TTL", "900"))
+FEATURES_TTL = float(os.getenv("SPOTIFY_FEATURES_TTL", "86400"))
+STALE_TTL = float(os.getenv("SPOTIFY_STALE_TTL", "86400"))
+CACHE_SIZE = int(os.getenv("SPOTIFY_CACHE_SIZE", "2048"))
+CACHE_SNAPSHOT = os.getenv("SPOTIFY_CACHE_SNAPSHOT")
+
+# Multi-artist recommendations: parallel upstream calls, and how long to wait for them
+FANOUT_CONCURRENCY = int(os.getenv("SPOTIFY_FANOUT_CONCURRENCY", "5"))
+FANOUT_TIMEOUT = float(os.getenv("SPOTIFY_FANOUT_TIMEOUT", "5"))
+
+# Speculative recommendation prefetch after an artist search: max prefetches in
+# flight, and the number of in-flight user requests at which they are cancelled
+PREFETCH_MAX_INFLIGHT = int(os.getenv("SPOTIFY_PREFETCH_MAX_INFLIGHT", "10"))
+PREFETCH_OVERLOAD = int(os.getenv("SPOTIFY_PREFETCH_OVERLOAD", "32"))
+
+# Recommendations are requested at bucketed energies so nearby moods share entries
+ENERGY_STEP = 0.1
+
+# Most track ids /audio-features accepts per request
+FEATURES_BATCH = 100
+
 TOKEN_URL = "https://accounts.spotify.com/api/token"
 API_BASE = "https://api.spotify.com/v1"
 
+_requests = metrics.counter("spotify_requests_total", "HTTP requests sent to Spotify")
+_connections = metrics.counter("spotify_connections_opened_total", "New TCP/TLS connections to Spotify")
+_token_refreshes = metrics.counter("spotify_token_refreshes_total", "Access tokens fetched")
+_cache_hits = metrics.counter("spotify_cache_hits_total", "Spotify responses served fresh from cache")
+_cache_stale = metrics.counter("spotify_cache_stale_hits_total", "Stale responses served while refreshing")
+_cache_misses = metrics.counter("spotify_cache_misses_total", "Spotify lookups that waited on upstream")
+_cache_refreshes = metrics.counter("spotify_cache_refreshes_total", "Background stale-while-revalidate refreshes")
+_prefetch_issued = metrics.counter("spotify_prefetch_issued_total", "Speculative recommendation fetches started")
+_prefetch_hits = metrics.counter("spotify_prefetch_hits_total", "Prefetched recommendations later requested")
+_prefetch_wasted = metrics.counter("spotify_prefetch_wasted_total", "Prefetched recommendations that expired unused")
+_prefetch_dropped = metrics.counter("spotify_prefetch_dropped_total", "Prefetches skipped because of the in-flight cap or load")
+_prefetch_cancelled = metrics.counter("spotify_prefetch_cancelled_total", "Prefetches cancelled on overload")
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _connections.inc()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _connections.inc()
+        return super()._new_conn()
+
+
+class _PooledAdapter(HTTPAdapter):
+    """
+    Keep-alive adapter that counts the connections it has to open, so
+    connection reuse = 1 - connections / requests.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
 
 @dataclass
 class SpotifyArtist:
@@ -33,94 +111,757 @@ class SpotifyTrack:
     popularity: int
 
 
+@dataclass
+class TrackFeatures:
+    id: str
+    energy: Optional[float]  # None: Spotify has no audio features for the track
+
+
+@dataclass
+class Playlist:
+    tracks: List[SpotifyTrack]
+    failed: List[str]  # seed artist ids whose recommendations failed or timed out
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.failed)
+
+
+# Snapshot rows are rebuilt by the type named in their key's prefix
+_SNAPSHOT_TYPES = {"artists": SpotifyArtist, "tracks": SpotifyTrack, "features": TrackFeatures}
+
+
+def energy_bucket(energy: float) -> float:
+    energy = min(1.0, max(0.1, energy))
+    return round(round(energy / ENERGY_STEP) * ENERGY_STEP, 2)
+
+
+def _artists_key(genre: str, limit: int, offset: int) -> str:
+    return f"artists|{genre}|{limit}|{offset}|{MARKET}"
+
+
+def _tracks_key(seed_artists: List[str], energy: float, limit: int) -> str:
+    return f"tracks|{','.join(seed_artists[:5])}|{energy}|{limit}|{MARKET}"
+
+
+def _features_key(track_id: str) -> str:
+    return f"features|{track_id}"
+
+
+def merge_recommendations(
+    per_artist: List[List[SpotifyTrack]],
+    limit: int,
+    target_energy: float,
+    energies: Dict[str, float]
+) -> List[SpotifyTrack]:
+    """
+    De-duplicates by track id and ranks by popularity plus energy fit,
+    1 - |energy - target_energy|, with `energies` from audio features (a
+    track without them gets no fit). Tracks suggested for several seeds get
+    a bonus for each extra seed. Ties go to the track placed earlier in its
+    seed's response.
+    """
+    best: Dict[str, SpotifyTrack] = {}
+    scores: Dict[str, float] = {}
+    seed_ranks: Dict[str, float] = {}
+
+    for tracks in per_artist:
+        n = max(1, len(tracks))
+        for pos, t in enumerate(tracks):
+            seed_rank = 1.0 - pos / n
+            if t.id in scores:
+                scores[t.id] += 0.25
+                seed_ranks[t.id] = max(seed_ranks[t.id], seed_rank)
+                continue
+            energy = energies.get(t.id)
+            fit = 1.0 - abs(energy - target_energy) if energy is not None else 0.0
+            scores[t.id] = t.popularity / 100 + fit
+            seed_ranks[t.id] = seed_rank
+            best[t.id] = t
+
+    ranked = sorted(scores, key=lambda track_id: (scores[track_id], seed_ranks[track_id]), reverse=True)
+    return [best[track_id] for track_id in ranked[:limit]]
+
+
+def _candidate_ids(per_artist: List[List[SpotifyTrack]]) -> List[str]:
+    return list(dict.fromkeys(t.id for tracks in per_artist for t in tracks))
+
+
+class ResponseCache:
+    """
+    LRU of parsed Spotify responses. An entry is fresh for its TTL, then
+    stale (still served, refreshed in the background) for `stale_ttl`, then
+    gone. Timestamps are wall-clock so a snapshot stays meaningful across
+    restarts.
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, stale_ttl: float = STALE_TTL, snapshot_path: Optional[str] = None):
+        self.max_entries = max(1, max_entries)
+        self.stale_ttl = stale_ttl
+        self.snapshot_path = snapshot_path
+        # key -> (value, fresh_until)
+        self._entries: "OrderedDict[str, Tuple[list, float]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        if snapshot_path:
+            self.load_snapshot()
+
+    def lookup(self, key: str) -> Tuple[Optional[list], bool]:
+        """
+        Returns (value, is_stale); value is None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            value, fresh_until = entry
+            if now >= fresh_until + self.stale_ttl:
+                del self._entries[key]
+                return None, False
+            self._entries.move_to_end(key)
+            return value, now >= fresh_until
+
+    def store(self, key: str, value: list, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def claim_refresh(self, key: str) -> bool:
+        # single-flight: only the first caller gets to refresh a stale key
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def release_refresh(self, key: str) -> None:
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------- SNAPSHOT ----------
+
+    def save_snapshot(self) -> None:
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            rows = [
+                {"key": key, "fresh_until": fresh_until, "items": [asdict(v) for v in value]}
+                for key, (value, fresh_until) in self._entries.items()
+            ]
+        # a private temp file per writer: several workers save at shutdown
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(rows, f)
+            os.replace(tmp, self.snapshot_path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def load_snapshot(self) -> None:
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        now = time.time()
+        with self._lock:
+            for row in rows:
+                if now >= row["fresh_until"] + self.stale_ttl:
+                    continue
+                cls = _SNAPSHOT_TYPES[row["key"].split("|", 1)[0]]
+                self._entries[row["key"]] = ([cls(**item) for item in row["items"]], row["fresh_until"])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _basic_auth() -> Dict[str, str]:
+    auth = base64.b64encode(f"{CLIENT_ID}:{CLIENT_SECRET}".encode()).decode()
+    return {"Authorization": f"Basic {auth}"}
+
+
+def _artist_search_params(genre: str, limit: int, offset: int) -> dict:
+    return {
+        "q": f"genre:{genre}",
+        "type": "artist",
+        "limit": limit,
+        "offset": offset,
+        "market": MARKET
+    }
+
+
+def _parse_artists(data: dict) -> List[SpotifyArtist]:
+    items = data.get("artists", {}).get("items", [])
+    items.sort(key=lambda a: a.get("popularity", 0), reverse=True)
+
+    return [
+        SpotifyArtist(
+            id=a["id"],
+            name=a["name"],
+            url=a["external_urls"]["spotify"],
+            popularity=a["popularity"]
+        )
+        for a in items
+    ]
+
+
+def _recommend_params(seed_artists: List[str], energy: float, limit: int) -> dict:
+    return {
+        "seed_artists": ",".join(seed_artists[:5]),
+        "limit": limit,
+        "market": MARKET,
+        "target_energy": min(1.0, max(0.1, energy)),
+        "target_valence": min(1.0, max(0.1, energy))
+    }
+
+
+def _parse_tracks(data: dict) -> List[SpotifyTrack]:
+    tracks = []
+    for t in data.get("tracks", []):
+        tracks.append(
+            SpotifyTrack(
+                id=t["id"],
+                name=t["name"],
+                artist=t["artists"][0]["name"],
+                url=t["external_urls"]["spotify"],
+                popularity=t["popularity"]
+            )
+        )
+
+    return tracks
+
+
+def _features_params(track_ids: List[str]) -> dict:
+    return {"ids": ",".join(track_ids)}
+
+
+def _parse_features(track_ids: List[str], data: dict) -> List[TrackFeatures]:
+    # one entry per requested id, null for tracks without features
+    found = {f["id"]: f.get("energy") for f in data.get("audio_features", []) if f}
+    return [TrackFeatures(id=track_id, energy=found.get(track_id)) for track_id in track_ids]
+
+
+def _cached_energies(cache: Optional[ResponseCache], track_ids: List[str]) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Returns (energies, missing). Audio features never change, so stale
+    entries are used as they are.
+    """
+    if cache is None:
+        return {}, list(track_ids)
+
+    energies, missing = {}, []
+    for track_id in track_ids:
+        value, _ = cache.lookup(_features_key(track_id))
+        if value is None:
+            missing.append(track_id)
+        elif value[0].energy is not None:
+            energies[track_id] = value[0].energy
+    _cache_hits.inc(len(track_ids) - len(missing))
+    _cache_misses.inc(len(missing))
+    return energies, missing
+
+
+def _store_energies(cache: Optional[ResponseCache], features: List[TrackFeatures]) -> Dict[str, float]:
+    if cache is not None:
+        for f in features:
+            cache.store(_features_key(f.id), [f], FEATURES_TTL)
+    return {f.id: f.energy for f in features if f.energy is not None}
+
+
 class SpotifyClient:
-    def __init__(self):
+    """
+    Thread-safe: one pooled keep-alive session is shared by all callers, and
+    only one thread at a time refreshes the access token. Responses go
+    through `cache` (pass None to disable caching).
+    """
+
+    def __init__(
+        self,
+        pool_size: int = POOL_SIZE,
+        refresh_margin: float = TOKEN_REFRESH_MARGIN,
+        cache: Optional[ResponseCache] = None
+    ):
+        self.cache = cache
+        # stale-while-revalidate refreshes; threads start on first submit
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="spotify-refresh")
         self._token: Optional[str] = None
         self._expires: float = 0
+        self._refresh_margin = refresh_margin
+        self._token_lock = threading.Lock()
+
+        self._session = requests.Session()
+        adapter = _PooledAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def close(self):
+        self._refresher.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            self.cache.save_snapshot()
+        self._session.close()
 
     def _token_headers(self):
-        if self._token and time.time() < self._expires:
+        now = time.time()
+        if self._token and now < self._expires - self._refresh_margin:
             return {"Authorization": f"Bearer {self._token}"}
 
-        auth = base64.b64encode(f"{CLIENT_ID}:{CLIENT_SECRET}".encode()).decode()
-        r = requests.post(
-            TOKEN_URL,
-            headers={"Authorization": f"Basic {auth}"},
-            data={"grant_type": "client_credentials"},
-            timeout=15
-        )
+        if self._token and now < self._expires:
+            # proactive refresh: one thread renews, the others keep using
+            # the still-valid token instead of waiting
+            if not self._token_lock.acquire(blocking=False):
+                return {"Authorization": f"Bearer {self._token}"}
+        else:
+            self._token_lock.acquire()
+
+        try:
+            # another thread may have refreshed while we waited
+            if not self._token or time.time() >= self._expires - self._refresh_margin:
+                self._refresh_token()
+            return {"Authorization": f"Bearer {self._token}"}
+        finally:
+            self._token_lock.release()
+
+    def _refresh_token(self):
+        _requests.inc()
+        with metrics.timer("spotify_token"):
+            r = self._session.post(
+                TOKEN_URL,
+                headers=_basic_auth(),
+                data={"grant_type": "client_credentials"},
+                timeout=15
+            )
         r.raise_for_status()
         data = r.json()
         self._token = data["access_token"]
-        self._expires = time.time() + data["expires_in"] - 30
-        return {"Authorization": f"Bearer {self._token}"}
+        self._expires = time.time() + data["expires_in"]
+        _token_refreshes.inc()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": _requests.value,
+            "connections_opened": _connections.value,
+            "token_refreshes": _token_refreshes.value,
+        }
 
     def _get(self, path, params=None):
-        r = requests.get(
-            API_BASE + path,
-            headers=self._token_headers(),
-            params=params,
-            timeout=15
-        )
+        headers = self._token_headers()
+        _requests.inc()
+        with metrics.timer("spotify_api"):
+            r = self._session.get(
+                API_BASE + path,
+                headers=headers,
+                params=params,
+                timeout=15
+            )
         r.raise_for_status()
         return r.json()
 
+    def _cached(self, key: str, ttl: float, fetch: Callable[[], list]) -> list:
+        if self.cache is None:
+            return fetch()
+
+        value, stale = self.cache.lookup(key)
+        if value is None:
+            _cache_misses.inc()
+            value = fetch()
+            self.cache.store(key, value, ttl)
+            return list(value)
+
+        if not stale:
+            _cache_hits.inc()
+        else:
+            _cache_stale.inc()
+            if self.cache.claim_refresh(key):
+                self._refresher.submit(self._refresh, key, ttl, fetch)
+        return list(value)
+
+    def _refresh(self, key: str, ttl: float, fetch: Callable[[], list]) -> None:
+        try:
+            self.cache.store(key, fetch(), ttl)
+            _cache_refreshes.inc()
+        except Exception as exc:
+            # keep serving the stale value; the next hit will try again
+            print("SPOTIFY REFRESH FAILED:", key, exc)
+        finally:
+            self.cache.release_refresh(key)
+
     # ---------- ARTISTS ----------
 
     def popular_artists_by_genre(self, genre: str, limit=5, offset=0) -> List[SpotifyArtist]:
-        data = self._get(
-            "/search",
-            {
-                "q": f"genre:{genre}",
-                "type": "artist",
-                "limit": limit,
-                "offset": offset,
-                "market": MARKET
-            }
+        return self._cached(
+            _artists_key(genre, limit, offset),
+            ARTIST_TTL,
+            lambda: _parse_artists(self._get("/search", _artist_search_params(genre, limit, offset)))
         )
 
-        items = data.get("artists", {}).get("items", [])
-        items.sort(key=lambda a: a.get("popularity", 0), reverse=True)
+    # ---------- TRACKS ----------
+
+    def recommend_tracks(
+        self,
+        seed_artists: List[str],
+        mood_energy: float,
+        limit=10
+    ) -> List[SpotifyTrack]:
+        energy = energy_bucket(mood_energy)
 
-        return [
-            SpotifyArtist(
-                id=a["id"],
-                name=a["name"],
-                url=a["external_urls"]["spotify"],
-                popularity=a["popularity"]
+        return self._cached(
+            _tracks_key(seed_artists, energy, limit),
+            RECOMMEND_TTL,
+            lambda: _parse_tracks(self._get("/recommendations", _recommend_params(seed_artists, energy, limit)))
+        )
+
+    def track_energies(self, track_ids: List[str]) -> Dict[str, float]:
+        """
+        Energy of each track from its audio features: cached ones from the
+        cache, the rest in one /audio-features request per 100 ids. Tracks
+        Spotify has no features for are left out.
+        """
+        energies, missing = _cached_energies(self.cache, track_ids)
+        for i in range(0, len(missing), FEATURES_BATCH):
+            batch = missing[i:i + FEATURES_BATCH]
+            data = self._get("/audio-features", _features_params(batch))
+            energies.update(_store_energies(self.cache, _parse_features(batch, data)))
+        return energies
+
+    def recommend_for_artists(
+        self,
+        artist_ids: List[str],
+        mood_energy: float,
+        per_artist=10,
+        limit=20,
+        concurrency=FANOUT_CONCURRENCY,
+        timeout=FANOUT_TIMEOUT,
+        target_energy: Optional[float] = None
+    ) -> Playlist:
+        """
+        Recommendations for each artist fetched in parallel, merged into one
+        list ranked by popularity and closeness to `target_energy` (default
+        `mood_energy`). Artists that fail or miss the overall `timeout` are
+        reported in `failed`.
+        """
+        if not artist_ids:
+            return Playlist(tracks=[], failed=[])
+
+        pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="spotify-fanout")
+        try:
+            futures = {
+                pool.submit(self.recommend_tracks, [artist_id], mood_energy, per_artist): artist_id
+                for artist_id in artist_ids
+            }
+            done, _ = wait(futures, timeout=timeout)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        results, failed = [], []
+        for future, artist_id in futures.items():
+            if future in done and future.exception() is None:
+                results.append(future.result())
+            else:
+                failed.append(artist_id)
+
+        try:
+            energies = self.track_energies(_candidate_ids(results))
+        except Exception as exc:
+            # rank on popularity alone rather than fail the playlist
+            print("SPOTIFY AUDIO FEATURES FAILED:", repr(exc))
+            energies = {}
+
+        target = mood_energy if target_energy is None else target_energy
+        return Playlist(tracks=merge_recommendations(results, limit, target, energies), failed=failed)
+
+
+class AsyncSpotifyClient:
+    """
+    asyncio counterpart of SpotifyClient on a pooled httpx.AsyncClient, so
+    waiting on Spotify does not hold a worker thread. Shares the response
+    cache format, parsing and metrics with the threaded client.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = POOL_SIZE,
+        refresh_margin: float = TOKEN_REFRESH_MARGIN,
+        cache: Optional[ResponseCache] = None
+    ):
+        self.cache = cache
+        self._pool_size = pool_size
+        self._refresh_margin = refresh_margin
+        self._http: Optional[httpx.AsyncClient] = None
+        self._token: Optional[str] = None
+        self._expires: float = 0
+        self._token_lock = asyncio.Lock()
+        self._tasks = set()
+
+        self._foreground = 0  # user-facing upstream calls in flight
+        self._prefetch_tasks: Dict[str, asyncio.Task] = {}
+        self._prefetched: Dict[str, float] = {}  # key -> when it landed in the cache
+
+    def _client(self) -> httpx.AsyncClient:
+        # created on first use so it binds to the serving event loop
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=15,
+                limits=httpx.Limits(max_connections=self._pool_size, max_keepalive_connections=self._pool_size),
             )
-            for a in items
-        ]
+        return self._http
+
+    async def aclose(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self.cache is not None:
+            self.cache.save_snapshot()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def _spawn(self, coro: Awaitable) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _token_headers(self):
+        now = time.time()
+        if self._token and now < self._expires - self._refresh_margin:
+            return {"Authorization": f"Bearer {self._token}"}
+
+        if self._token and now < self._expires and self._token_lock.locked():
+            # a refresh is already underway; the current token is still valid
+            return {"Authorization": f"Bearer {self._token}"}
+
+        async with self._token_lock:
+            if not self._token or time.time() >= self._expires - self._refresh_margin:
+                _requests.inc()
+                with metrics.timer("spotify_token"):
+                    r = await self._client().post(
+                        TOKEN_URL,
+                        headers=_basic_auth(),
+                        data={"grant_type": "client_credentials"}
+                    )
+                r.raise_for_status()
+                data = r.json()
+                self._token = data["access_token"]
+                self._expires = time.time() + data["expires_in"]
+                _token_refreshes.inc()
+            return {"Authorization": f"Bearer {self._token}"}
+
+    async def _get(self, path, params=None, background=False):
+        if background:
+            return await self._send(path, params)
+
+        self._foreground += 1
+        if self._foreground >= PREFETCH_OVERLOAD and self._prefetch_tasks:
+            self._cancel_prefetches()
+        try:
+            return await self._send(path, params)
+        finally:
+            self._foreground -= 1
+
+    async def _send(self, path, params):
+        headers = await self._token_headers()
+        _requests.inc()
+        with metrics.timer("spotify_api"):
+            r = await self._client().get(API_BASE + path, headers=headers, params=params)
+        r.raise_for_status()
+        return r.json()
+
+    async def _cached(self, key: str, ttl: float, fetch: Callable[[], Awaitable[list]]) -> list:
+        if self.cache is None:
+            return await fetch()
+
+        value, stale = self.cache.lookup(key)
+        if value is None:
+            _cache_misses.inc()
+            value = await fetch()
+            self.cache.store(key, value, ttl)
+            return list(value)
+
+        if not stale:
+            _cache_hits.inc()
+        else:
+            _cache_stale.inc()
+            if self.cache.claim_refresh(key):
+                self._spawn(self._refresh(key, ttl, fetch))
+        return list(value)
+
+    async def _refresh(self, key: str, ttl: float, fetch: Callable[[], Awaitable[list]]) -> None:
+        try:
+            self.cache.store(key, await fetch(), ttl)
+            _cache_refreshes.inc()
+        except Exception as exc:
+            print("SPOTIFY REFRESH FAILED:", key, exc)
+        finally:
+            self.cache.release_refresh(key)
+
+    # ---------- ARTISTS ----------
+
+    async def popular_artists_by_genre(self, genre: str, limit=5, offset=0) -> List[SpotifyArtist]:
+        async def fetch():
+            return _parse_artists(await self._get("/search", _artist_search_params(genre, limit, offset)))
+
+        return await self._cached(_artists_key(genre, limit, offset), ARTIST_TTL, fetch)
 
     # ---------- TRACKS ----------
 
-    def recommend_tracks(
+    async def recommend_tracks(
         self,
         seed_artists: List[str],
         mood_energy: float,
         limit=10
     ) -> List[SpotifyTrack]:
+        energy = energy_bucket(mood_energy)
+        key = _tracks_key(seed_artists, energy, limit)
 
-        params = {
-            "seed_artists": ",".join(seed_artists[:5]),
-            "limit": limit,
-            "market": MARKET,
-            "target_energy": min(1.0, max(0.1, mood_energy)),
-            "target_valence": min(1.0, max(0.1, mood_energy))
+        pending = self._prefetch_tasks.get(key)
+        if pending is not None:
+            # the prefetch is already on its way; wait for it instead of asking
+            # twice. wait() never raises the task's outcome: if it failed or
+            # was cancelled under overload, the normal fetch below runs instead
+            await asyncio.wait({pending})
+        self._consume_prefetch(key)
+
+        async def fetch():
+            return _parse_tracks(await self._get("/recommendations", _recommend_params(seed_artists, energy, limit)))
+
+        return await self._cached(key, RECOMMEND_TTL, fetch)
+
+    async def track_energies(self, track_ids: List[str]) -> Dict[str, float]:
+        energies, missing = _cached_energies(self.cache, track_ids)
+        for i in range(0, len(missing), FEATURES_BATCH):
+            batch = missing[i:i + FEATURES_BATCH]
+            data = await self._get("/audio-features", _features_params(batch))
+            energies.update(_store_energies(self.cache, _parse_features(batch, data)))
+        return energies
+
+    # ---------- PREFETCH ----------
+
+    def prefetch_recommendations(self, artist_ids: List[str], mood_energy: float, limit=10) -> int:
+        """
+        Starts background fetches of recommend_tracks([artist_id], ...) for
+        each artist so a follow-up request is a cache hit. Returns how many
+        were started; skipped when uncached, already cached, over the
+        in-flight cap, or while user traffic is high.
+        """
+        if self.cache is None:
+            return 0
+        self._sweep_prefetched()
+
+        energy = energy_bucket(mood_energy)
+        started = 0
+        for artist_id in artist_ids:
+            key = _tracks_key([artist_id], energy, limit)
+            if key in self._prefetch_tasks:
+                continue
+            value, stale = self.cache.lookup(key)
+            if value is not None and not stale:
+                continue
+            if self._foreground >= PREFETCH_OVERLOAD or len(self._prefetch_tasks) >= PREFETCH_MAX_INFLIGHT:
+                _prefetch_dropped.inc()
+                continue
+
+            _prefetch_issued.inc()
+            self._prefetch_tasks[key] = self._spawn(self._prefetch_one(key, artist_id, energy, limit))
+            started += 1
+
+        return started
+
+    async def _prefetch_one(self, key: str, artist_id: str, energy: float, limit: int) -> None:
+        try:
+            data = await self._get("/recommendations", _recommend_params([artist_id], energy, limit), background=True)
+            self.cache.store(key, _parse_tracks(data), RECOMMEND_TTL)
+            self._prefetched[key] = time.time()
+        except asyncio.CancelledError:
+            _prefetch_cancelled.inc()
+            raise
+        except Exception as exc:
+            print("SPOTIFY PREFETCH FAILED:", artist_id, exc)
+        finally:
+            self._prefetch_tasks.pop(key, None)
+
+    def _cancel_prefetches(self) -> None:
+        for task in list(self._prefetch_tasks.values()):
+            task.cancel()
+
+    def _consume_prefetch(self, key: str) -> None:
+        landed = self._prefetched.pop(key, None)
+        if landed is None:
+            return
+        if time.time() - landed < RECOMMEND_TTL:
+            _prefetch_hits.inc()
+        else:
+            _prefetch_wasted.inc()
+
+    def _sweep_prefetched(self) -> None:
+        cutoff = time.time() - RECOMMEND_TTL
+        for key, landed in list(self._prefetched.items()):
+            if landed < cutoff:
+                del self._prefetched[key]
+                _prefetch_wasted.inc()
+
+    def prefetch_stats(self) -> Dict[str, float]:
+        issued = _prefetch_issued.value
+        return {
+            "issued": issued,
+            "hits": _prefetch_hits.value,
+            "wasted": _prefetch_wasted.value,
+            "dropped": _prefetch_dropped.value,
+            "cancelled": _prefetch_cancelled.value,
+            "in_flight": len(self._prefetch_tasks),
+            "hit_ratio": _prefetch_hits.value / issued if issued else 0.0,
+            "waste_ratio": _prefetch_wasted.value / issued if issued else 0.0,
         }
 
-        data = self._get("/recommendations", params)
-
-        tracks = []
-        for t in data.get("tracks", []):
-            tracks.append(
-                SpotifyTrack(
-                    id=t["id"],
-                    name=t["name"],
-                    artist=t["artists"][0]["name"],
-                    url=t["external_urls"]["spotify"],
-                    popularity=t["popularity"]
+    async def recommend_for_artists(
+        self,
+        artist_ids: List[str],
+        mood_energy: float,
+        per_artist=10,
+        limit=20,
+        concurrency=FANOUT_CONCURRENCY,
+        timeout=FANOUT_TIMEOUT,
+        target_energy: Optional[float] = None
+    ) -> Playlist:
+        """
+        Recommendations for each artist fetched concurrently (at most
+        `concurrency` at a time, each bounded by `timeout`), merged into one
+        list ranked by popularity and closeness to `target_energy` (default
+        `mood_energy`). Artists that fail or time out are reported in `failed`.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(artist_id: str) -> List[SpotifyTrack]:
+            async with semaphore:
+                return await asyncio.wait_for(
+                    self.recommend_tracks([artist_id], mood_energy, per_artist), timeout
                 )
-            )
 
-        return tracks
+        outcomes = await asyncio.gather(*(one(a) for a in artist_ids), return_exceptions=True)
+
+        results, failed = [], []
+        for artist_id, outcome in zip(artist_ids, outcomes):
+            if isinstance(outcome, BaseException):
+                print("SPOTIFY FANOUT FAILED:", artist_id, repr(outcome))
+                failed.append(artist_id)
+            else:
+                results.append(outcome)
+
+        try:
+            energies = await asyncio.wait_for(self.track_energies(_candidate_ids(results)), timeout)
+        except Exception as exc:
+            print("SPOTIFY AUDIO FEATURES FAILED:", repr(exc))
+            energies = {}
+
+        target = mood_energy if target_energy is None else target_energy
+        return Playlist(tracks=merge_recommendations(results, limit, target, energies), failed=failed)
@@ -1,16 +1,12 @@
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional, Tuple
 import numpy as np
 
-from sentence_transformers import SentenceTransformer
-
+from . import metrics
+from .embedder import encode
 from .emotion_engine import MoodProfile
 
 
-# Load once (fast after first run)
-_EMBEDDER = SentenceTransformer("all-MiniLM-L6-v2")
-
-
 @dataclass
 class SongPlan:
     key: str
@@ -70,20 +66,33 @@ GENRE_PROFILES = {
 }
 
 
-def _pick_genre_by_text(description: str) -> str:
-    desc_emb = _EMBEDDER.encode(description, normalize_embeddings=True)
+# Prototype embeddings, rebuilt only when the anchor texts change
+_anchor_key: Optional[Tuple] = None
+_anchor_genres: List[str] = []
+_anchor_matrix: Optional[np.ndarray] = None
+
 
-    best_genre = "pop"
-    best_score = -1.0
+def _genre_anchors() -> Tuple[List[str], np.ndarray]:
+    global _anchor_key, _anchor_genres, _anchor_matrix
+
+    key = tuple((genre, cfg["text"]) for genre, cfg in GENRE_PROFILES.items())
+    if key != _anchor_key:
+        texts = [cfg["text"] for cfg in GENRE_PROFILES.values()]
+        _anchor_matrix = encode(texts, normalize_embeddings=True)
+        _anchor_genres = list(GENRE_PROFILES)
+        _anchor_key = key
+
+    return _anchor_genres, _anchor_matrix
+
+
+def _pick_genre_by_text(description: str) -> str:
+    with metrics.timer("embed"):
+        desc_emb = encode(description, normalize_embeddings=True)
 
-    for genre, cfg in GENRE_PROFILES.items():
-        g_emb = _EMBEDDER.encode(cfg["text"], normalize_embeddings=True)
-        score = float(np.dot(desc_emb, g_emb))
-        if score > best_score:
-            best_score = score
-            best_genre = genre
+    genres, anchors = _genre_anchors()
+    scores = anchors @ desc_emb
 
-    return best_genre
+    return genres[int(np.argmax(scores))]
 
 
 def plan_song(mood: MoodProfile, genre: str | None = None) -> SongPlan:
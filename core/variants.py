@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import random
+import zipfile
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from core.ai_music_brain import MusicProfile
+from core.groove_engine import groove_signature
+from core.harmony_engine import progression_offsets
+from core.midi_engine import ROOTS, SECTION_ORDER, render_to_midi_bytes
+
+MAX_VARIANTS = int(os.getenv("MEUPHONIC_MAX_VARIANTS", "16"))
+
+# Drum energy offsets; each lands in a different groove density step
+GROOVE_SHIFTS = (0.0, -0.1, 0.1, -0.2, 0.2)
+
+
+@dataclass(frozen=True)
+class Variant:
+    key: str                                # home note, one of ROOTS
+    progression: Optional[Tuple[str, ...]]  # chord symbols; None keeps the section harmony
+    progression_key: str                    # key the progression is written in
+    groove_energy: float
+
+
+def _progressions(genre: str) -> Tuple[List[List[str]], str]:
+    # imported here: the theory engine loads the VADER lexicon, which the web
+    # process and render workers otherwise never need
+    from core.theory_engine import GENRE_PROFILES
+
+    # genres without a theory profile (classical) borrow pop's
+    cfg = GENRE_PROFILES.get(genre) or GENRE_PROFILES["pop"]
+    return cfg["progressions"], cfg["key"]
+
+
+def plan_variants(profile: MusicProfile, count: int, seed: int = 0) -> List[Variant]:
+    """
+    `count` distinct variations of the song. The first is the song itself;
+    the rest are drawn, without repeats and in an order fixed by `seed`,
+    from every combination of key, the genre's progressions and groove
+    density.
+    """
+    count = max(1, min(count, MAX_VARIANTS))
+    progressions, prog_key = _progressions(profile.genre)
+    harmonies: List[Optional[Tuple[str, ...]]] = [None] + [tuple(p) for p in progressions]
+
+    # energies whose drums come out the same count once
+    sections = [name for name, _ in SECTION_ORDER]
+    grooves = {}
+    for shift in GROOVE_SHIFTS:
+        # the unshifted energy is the song's own, so variant 0 is the song as-is
+        energy = round(min(1.0, max(0.2, profile.energy + shift)), 3) if shift else profile.energy
+        grooves.setdefault(groove_signature(profile.genre, energy, sections), energy)
+    energies = list(grooves.values())  # the profile's own energy first
+
+    original = Variant("A", None, prog_key, energies[0])
+    others = [
+        Variant(k, h, prog_key, e)
+        for k in ROOTS for h in harmonies for e in energies
+        if (k, h, e) != ("A", None, energies[0])
+    ]
+    random.Random(seed).shuffle(others)
+    return [original] + others[:count - 1]
+
+
+def render_variant(profile: MusicProfile, variant: Variant) -> bytes:
+    progression = progression_offsets(variant.progression, variant.progression_key) if variant.progression else None
+    return render_to_midi_bytes(
+        profile,
+        tonic=ROOTS[variant.key],
+        progression=progression,
+        groove_energy=variant.groove_energy,
+    )
+
+
+def render_variants(profile: MusicProfile, variants: Sequence[Variant]) -> List[bytes]:
+    """
+    Renders every variant in this process; the groove table and harmony plans
+    filled by the first are shared by the rest.
+    """
+    return [render_variant(profile, v) for v in variants]
+
+
+def variants_zip(profile: MusicProfile, variants: Sequence[Variant], songs: Sequence[bytes]) -> bytes:
+    """
+    One archive holding variant_XX.mid for each song plus variants.json,
+    which describes the profile and what each file varies.
+    """
+    manifest = {
+        "profile": asdict(profile),
+        "variants": [
+            {"file": f"variant_{i:02d}.mid", **asdict(v)} for i, v in enumerate(variants)
+        ],
+    }
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for entry, data in zip(manifest["variants"], songs):
+            zf.writestr(entry["file"], data)
+        zf.writestr("variants.json", json.dumps(manifest, indent=2))
+    return buf.getvalue()